@@ -1,6 +1,6 @@
 from stacked_diffs.utils import git
 from stacked_diffs.utils.classes import AddArgs, BranchMeta, Graph
-from stacked_diffs.utils.metadata import MetadataManager
+from stacked_diffs.utils.metadata import get_metadata_manager
 
 
 def handle_add(args: AddArgs) -> None:
@@ -17,7 +17,7 @@ def handle_add(args: AddArgs) -> None:
         Contains the `branch_name` attribute.
 
     """
-    mm = MetadataManager()
+    mm = get_metadata_manager()
     graph: Graph = mm.load_graph()
     parent_branch: str = git.get_current_branch()
     print(f"Current branch is '{parent_branch}'.")
@@ -2,8 +2,8 @@
 
 
 import argparse
+import functools
 import sys
-from dataclasses import asdict
 
 from stacked_diffs.utils.classes import (
     Alias,
@@ -14,13 +14,13 @@ from stacked_diffs.utils.classes import (
     AliasShowArgs,
     CommandConfig,
 )
-from stacked_diffs.utils.default_aliases import DEFAULT_ALIASES
-from stacked_diffs.utils.metadata import MetadataManager
+from stacked_diffs.utils.default_aliases import DEFAULT_ALIASES, DEFAULT_ALIASES_SORTED
+from stacked_diffs.utils.metadata import get_metadata_manager
 
 
 def handle_alias_set(args: AliasSetArgs) -> None:
     """Handle the 'alias set' sub-command."""
-    mm = MetadataManager()
+    mm = get_metadata_manager()
     # User aliases are stored in the same structured format as DEFAULT_ALIASES
     aliases: dict[str, Alias] = mm.load_user_aliases()
 
@@ -42,10 +42,10 @@ def handle_alias_set(args: AliasSetArgs) -> None:
     env_vars = {}
     if args.env:
         for env_pair in args.env:
-            if "=" not in env_pair:
+            key, sep, value = env_pair.partition("=")
+            if not sep:
                 print(f"Error: Environment variable '{env_pair}' must be in KEY=VALUE format.", file=sys.stderr)
                 sys.exit(1)
-            key, value = env_pair.split("=", 1)
             env_vars[key] = value
 
     # Create the alias using the dataclass
@@ -57,7 +57,7 @@ def handle_alias_set(args: AliasSetArgs) -> None:
         env=env_vars,
     )
 
-    aliases[args.alias_name] = asdict(alias)
+    aliases[args.alias_name] = alias
     mm.save_user_aliases(aliases)
 
     # Print confirmation using the alias object
@@ -83,44 +83,47 @@ def handle_alias_set(args: AliasSetArgs) -> None:
 
 def handle_alias_list(args: AliasListArgs) -> None:
     """Handle the 'alias list' sub-command."""
-    mm = MetadataManager()
+    mm = get_metadata_manager()
     user_aliases: dict[str, Alias] = mm.load_user_aliases()
+    lines: list[str] = []
 
-    def print_alias_details(name: str, alias_def: Alias, indent: str = "  ") -> None:
-        """Print detailed information about an alias."""
-        print(f"{indent}{name}: {alias_def.description}")
+    def add_alias_details(name: str, alias_def: Alias, indent: str = "  ") -> None:
+        """Append detailed information about an alias to the output lines."""
+        lines.append(f"{indent}{name}: {alias_def.description}")
         if args.verbose:
             if alias_def.command.run:
-                print(f"{indent}  Run: {alias_def.command.run}")
+                lines.append(f"{indent}  Run: {alias_def.command.run}")
             if alias_def.command.pre_flight:
-                print(f"{indent}  Pre-flight: {alias_def.command.pre_flight}")
+                lines.append(f"{indent}  Pre-flight: {alias_def.command.pre_flight}")
             if alias_def.command.post_flight:
-                print(f"{indent}  Post-flight: {alias_def.command.post_flight}")
+                lines.append(f"{indent}  Post-flight: {alias_def.command.post_flight}")
             if alias_def.command.descendants_only:
-                print(f"{indent}  Descendants only: Yes")
+                lines.append(f"{indent}  Descendants only: Yes")
             if alias_def.command.start_from_root:
-                print(f"{indent}  Start from root: Yes")
+                lines.append(f"{indent}  Start from root: Yes")
             if alias_def.continue_cmd:
-                print(f"{indent}  Continue command: {alias_def.continue_cmd}")
+                lines.append(f"{indent}  Continue command: {alias_def.continue_cmd}")
             if alias_def.abort_cmd:
-                print(f"{indent}  Abort command: {alias_def.abort_cmd}")
+                lines.append(f"{indent}  Abort command: {alias_def.abort_cmd}")
             if alias_def.env:
                 env_vars = ", ".join(f"{k}={v}" for k, v in alias_def.env.items())
-                print(f"{indent}  Environment: {env_vars}")
+                lines.append(f"{indent}  Environment: {env_vars}")
 
-    print("--- Built-in Aliases ---")
-    for name, a_def in sorted(DEFAULT_ALIASES.items()):
-        print_alias_details(name, a_def)
+    lines.append("--- Built-in Aliases ---")
+    for name, a_def in DEFAULT_ALIASES_SORTED:
+        add_alias_details(name, a_def)
 
     if user_aliases:
-        print("\n--- User-defined Aliases (.sd_aliases.json) ---")
+        lines.append("\n--- User-defined Aliases (.sd_aliases.json) ---")
         for name, alias_def in sorted(user_aliases.items()):
-            print_alias_details(name, alias_def)
+            add_alias_details(name, alias_def)
+
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
 def handle_alias_show(args: AliasShowArgs) -> None:
     """Handle the 'alias show' sub-command."""
-    mm = MetadataManager()
+    mm = get_metadata_manager()
     all_aliases: dict[str, Alias] = mm.get_all_aliases()
 
     if args.alias_name not in all_aliases:
@@ -130,32 +133,35 @@ def handle_alias_show(args: AliasShowArgs) -> None:
     alias_def = all_aliases[args.alias_name]
     is_builtin = args.alias_name in DEFAULT_ALIASES
 
-    print(f"Alias: {args.alias_name} {'(built-in)' if is_builtin else '(user-defined)'}")
-    print(f"Description: {alias_def.description}")
+    lines: list[str] = [
+        f"Alias: {args.alias_name} {'(built-in)' if is_builtin else '(user-defined)'}",
+        f"Description: {alias_def.description}",
+    ]
 
     if alias_def.command.run:
-        print(f"Run command: {alias_def.command.run}")
+        lines.append(f"Run command: {alias_def.command.run}")
     if alias_def.command.pre_flight:
-        print(f"Pre-flight command: {alias_def.command.pre_flight}")
+        lines.append(f"Pre-flight command: {alias_def.command.pre_flight}")
     if alias_def.command.post_flight:
-        print(f"Post-flight command: {alias_def.command.post_flight}")
+        lines.append(f"Post-flight command: {alias_def.command.post_flight}")
     if alias_def.command.descendants_only:
-        print("Descendants only: Yes")
+        lines.append("Descendants only: Yes")
     if alias_def.command.start_from_root:
-        print("Start from root: Yes")
+        lines.append("Start from root: Yes")
     if alias_def.continue_cmd:
-        print(f"Continue command: {alias_def.continue_cmd}")
+        lines.append(f"Continue command: {alias_def.continue_cmd}")
     if alias_def.abort_cmd:
-        print(f"Abort command: {alias_def.abort_cmd}")
+        lines.append(f"Abort command: {alias_def.abort_cmd}")
     if alias_def.env:
-        print("Environment variables:")
-        for key, value in alias_def.env.items():
-            print(f"  {key}={value}")
+        lines.append("Environment variables:")
+        lines.extend(f"  {key}={value}" for key, value in alias_def.env.items())
+
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
 def handle_alias_rm(args: AliasRmArgs) -> None:
     """Handle the 'alias rm' sub-command."""
-    mm = MetadataManager()
+    mm = get_metadata_manager()
     aliases: dict[str, Alias] = mm.load_user_aliases()
 
     if args.alias_name not in aliases:
@@ -167,8 +173,9 @@ def handle_alias_rm(args: AliasRmArgs) -> None:
     print(f"✅ User alias '{args.alias_name}' removed.")
 
 
-def handle_alias(args: AliasArgs) -> None:
-    """Dispatch 'alias' sub-commands."""
+@functools.cache
+def _build_alias_parser() -> argparse.ArgumentParser:
+    """Builds the 'sd alias' argument parser once and reuses it on later calls."""
     alias_parser = argparse.ArgumentParser(prog="sd alias", description="Manage command aliases.")
     alias_subparsers = alias_parser.add_subparsers(dest="alias_command", required=True)
 
@@ -206,7 +213,16 @@ def handle_alias(args: AliasArgs) -> None:
     parser_rm = alias_subparsers.add_parser("rm", help="Remove a user alias from .sd_aliases.json.")
     parser_rm.add_argument("alias_name")
 
-    alias_args = alias_parser.parse_args(sys.argv[2:])
+    return alias_parser
+
+
+def handle_alias(args: AliasArgs, alias_argv: list[str] | None = None) -> None:
+    """
+    Dispatch 'alias' sub-commands.
+
+    `alias_argv` holds the arguments after `alias`; it defaults to those in sys.argv.
+    """
+    alias_args = _build_alias_parser().parse_args(sys.argv[2:] if alias_argv is None else alias_argv)
 
     # Create appropriate dataclass instance based on subcommand
     if alias_args.alias_command == "set":
@@ -1,6 +1,8 @@
+from collections import defaultdict
+
 from stacked_diffs.utils import git
 from stacked_diffs.utils.classes import Graph, PruneArgs
-from stacked_diffs.utils.metadata import MetadataManager
+from stacked_diffs.utils.metadata import get_metadata_manager
 
 
 def handle_prune(args: PruneArgs) -> None:
@@ -17,12 +19,12 @@ def handle_prune(args: PruneArgs) -> None:
         The parsed command-line arguments as a dataclass.
 
     """
-    mm = MetadataManager()
+    mm = get_metadata_manager()
     graph: Graph = mm.load_graph()
 
     print("Checking for branches to prune...")
 
-    tracked_branches: set[str] = set(graph.branches.keys())
+    tracked_branches = graph.branches.keys()
     local_branches: set[str] = git.get_local_branches()
 
     # Find branches that are tracked in metadata but no longer exist locally
@@ -36,15 +38,23 @@ def handle_prune(args: PruneArgs) -> None:
     for branch in branches_to_remove:
         print(f" - '{branch}' (no longer exists locally)")
 
+    # Index which parents reference each child so only affected parents are rewritten
+    parents_of: defaultdict[str, list[str]] = defaultdict(list)
+    for parent, meta in graph.branches.items():
+        for child in meta.children:
+            parents_of[child].append(parent)
+
     # Remove branches from metadata
     for branch in branches_to_remove:
         graph.branches.pop(branch, None)
 
     # Clean up parent-child relationships
-    for parent in graph.branches:
-        graph.branches[parent].children = [
-            child for child in graph.branches[parent].children if child not in branches_to_remove
-        ]
+    affected_parents: set[str] = {parent for child in branches_to_remove for parent in parents_of.get(child, ())}
+    for parent in affected_parents:
+        if parent in graph.branches:
+            graph.branches[parent].children = [
+                c for c in graph.branches[parent].children if c not in branches_to_remove
+            ]
 
     mm.save_graph(graph)
     print("✅ Prune complete.")
@@ -1,11 +1,12 @@
 import subprocess
 import sys
 from collections import deque
+from functools import partial
 
 from stacked_diffs.utils import git
 from stacked_diffs.utils.classes import Alias, Graph, PlanAction, ResumeState, RunArgs
-from stacked_diffs.utils.metadata import MetadataManager
-from stacked_diffs.utils.util import run_command, run_shell_command
+from stacked_diffs.utils.metadata import MetadataManager, get_metadata_manager
+from stacked_diffs.utils.util import run_shell_command
 
 
 def handle_run(
@@ -27,7 +28,7 @@ def handle_run(
         as an alias.
 
     """
-    mm = MetadataManager()
+    mm = get_metadata_manager()
     graph: Graph = mm.load_graph()
     resume_state: ResumeState | None = mm.get_resume_state()
 
@@ -41,10 +42,10 @@ def handle_run(
     if cli_env_vars:  # These are only for new runs, not continue/abort
         env_vars.update(cli_env_vars)
 
-    cmd_config = alias_def.command if alias_def else vars(args)
-    user_command = cmd_config.run if alias_def else args.command_string
-    pre_flight_cmd = cmd_config.pre_flight if alias_def else args.pre_flight_cmd
-    post_flight_cmd = cmd_config.post_flight if alias_def else args.post_flight_cmd
+    cmd_config = alias_def.command if alias_def else None
+    user_command = cmd_config.run if cmd_config else args.command_string
+    pre_flight_cmd = cmd_config.pre_flight if cmd_config else args.pre_flight_cmd
+    post_flight_cmd = cmd_config.post_flight if cmd_config else args.post_flight_cmd
 
     # --- Continue/Abort Logic ---
     if args.continue_run or args.abort_run:
@@ -114,6 +115,7 @@ def _handle_continue_abort(
     remediation_shell_env = {"SD_CURRENT_BRANCH": git.get_current_branch()}
     remediation_shell_env.update(saved_env_vars)  # Make $REMOTE etc. available
     remediation_success = run_shell_command(remediation_cmd, env_vars=remediation_shell_env)
+    git.clear_current_branch_cache()
 
     if args.continue_run:
         if not remediation_success:
@@ -178,10 +180,11 @@ def _handle_new_run(
         )
 
     print(f"Starting '{args.command_name or 'run'}' on '{start_branch}'...")
+    git.warn_if_cycle(graph)
 
-    cmd_config = alias_def.command if alias_def else vars(args)
-    descendants_only = cmd_config.descendants_only if alias_def else False
-    start_from_root = cmd_config.start_from_root if alias_def else False
+    cmd_config = alias_def.command if alias_def else None
+    descendants_only = cmd_config.descendants_only if cmd_config else False
+    start_from_root = cmd_config.start_from_root if cmd_config else False
 
     plan_start_branch = start_branch
     if start_from_root:
@@ -207,8 +210,6 @@ def _handle_new_run(
         # No specific cleanup needed here if no plan and no post_flight, as no state was set.
         return
 
-    mm.save_graph(graph)
-
     _process_plan(
         plan=plan,
         user_command=user_command,
@@ -244,6 +245,8 @@ def _process_plan(
     """Executes a plan of commands, handling interruptions."""
     action_queue: deque[PlanAction] = deque(plan)
     custom_env_vars = custom_env_vars or {}
+    # Trunk and custom vars are loop-invariant; custom vars keep precedence over the per-branch ones
+    base_env: dict[str, str] = {"SD_TRUNK_BRANCH": graph.trunk, **custom_env_vars}
 
     while action_queue:
         action: PlanAction = action_queue.popleft()
@@ -261,13 +264,19 @@ def _process_plan(
         env_vars: dict[str, str] = {
             "SD_CURRENT_BRANCH": action.branch,
             "SD_PARENT_BRANCH": action.parent,
-            "SD_TRUNK_BRANCH": graph.trunk,
+            **base_env,
         }
-        env_vars.update(custom_env_vars)
-
-        run_command([git.GIT_EXECUTABLE, "checkout", action.branch])
 
-        success: bool = run_shell_command(user_command, env_vars=env_vars)
+        # Check out the branch as part of running the user command; when the command needs a
+        # shell, the checkout runs in the same shell process
+        checkout_cmd: list[str] = [git.GIT_EXECUTABLE, "checkout", "-q", action.branch]
+        success: bool = run_shell_command(
+            user_command,
+            env_vars=env_vars,
+            setup_command=checkout_cmd,
+            setup_succeeded=partial(_is_checked_out, action.branch),
+        )
+        git.clear_current_branch_cache()
 
         if not success:
             message: str = f"Command failed on branch '{action.branch}'."
@@ -280,6 +289,12 @@ def _process_plan(
             sys.exit(1)
 
 
+def _is_checked_out(branch: str) -> bool:
+    """Tells whether `branch` is checked out, bypassing the cached current branch."""
+    git.clear_current_branch_cache()
+    return git.get_current_branch() == branch
+
+
 def _run_pre_flight(
     *,
     pre_flight_cmd: str,
@@ -292,10 +307,10 @@ def _run_pre_flight(
     shell_env = {
         "SD_TRUNK_BRANCH": trunk,
         "SD_START_BRANCH": start_branch,
+        **(env_vars or {}),
     }
-    if env_vars:
-        shell_env.update(env_vars)
     success = run_shell_command(pre_flight_cmd, env_vars=shell_env, fail_on_error=False)
+    git.clear_current_branch_cache()
     print("---------------------------------")
     if not success:
         print("Error: Pre-flight command failed. Aborting operation.", file=sys.stderr)
@@ -314,10 +329,10 @@ def _run_post_flight(
     shell_env = {
         "SD_TRUNK_BRANCH": trunk,
         "SD_START_BRANCH": start_branch,
+        **(env_vars or {}),
     }
-    if env_vars:
-        shell_env.update(env_vars)
     success = run_shell_command(post_flight_cmd, env_vars=shell_env, fail_on_error=False)
+    git.clear_current_branch_cache()
     print("----------------------------------")
     if not success:
         print("Error: Post-flight command failed. Operation completed but cleanup may be incomplete.", file=sys.stderr)
@@ -335,7 +350,7 @@ def _perform_cleanup(
     try:
         if git.get_current_branch() != start_branch:
             print(f"Returning to '{start_branch}'...")
-            run_command([git.GIT_EXECUTABLE, "checkout", start_branch])
+            git.checkout_branch(start_branch)
     except subprocess.SubprocessError as e:
         print(
             f"Warning: Could not check out starting branch '{start_branch}': {e}",
@@ -343,17 +358,14 @@ def _perform_cleanup(
         )
 
     mm.clear_resume_state()  # Clears resume_state from file
-    # Load fresh graph to remove markers
-    graph_after_clear = mm.load_graph()
-    mm.save_graph(graph_after_clear)
     print(f"✅ Success! {action_str} complete for '{operation_name}'.")
 
 
-def _get_children_for_traversal(branch_name: str, graph: Graph) -> list[str]:
+def _get_children_for_traversal(branch_name: str, graph: Graph, child_to_parent: dict[str, str]) -> list[str]:
     """Helper to get children for traversal, handling trunk."""
     if branch_name == graph.trunk:
         # Children of trunk are the roots of all stacks
-        return [b_name for b_name in graph.branches if git.find_parent(b_name, graph) is None]
+        return [b_name for b_name in graph.branches if b_name not in child_to_parent]
     elif branch_name in graph.branches:
         return graph.branches[branch_name].children
     return []
@@ -370,14 +382,17 @@ def _build_traversal_plan(
     queue: deque[PlanAction] = deque()
     visited: set[str] = set()
     trunk = graph.trunk
+    child_to_parent = git.build_parent_index(graph)
 
     if not descendants_only:
-        parent_of_start = git.find_parent(start_branch, graph) or trunk
+        parent_of_start = git.find_parent(start_branch, graph, child_to_parent) or trunk
         queue.append(PlanAction(branch=start_branch, parent=parent_of_start))
     else:  # descendants_only is True
         # This mode is for operations like 'update' where the start_branch itself is skipped.
         # We need to add its direct children to the queue.
-        for child in _get_children_for_traversal(branch_name=start_branch, graph=graph):
+        for child in _get_children_for_traversal(
+            branch_name=start_branch, graph=graph, child_to_parent=child_to_parent
+        ):
             queue.append(PlanAction(branch=child, parent=start_branch))
 
     while queue:
@@ -390,7 +405,9 @@ def _build_traversal_plan(
         plan.append(current_action)
 
         # Determine children for the next level of traversal
-        children_to_visit = _get_children_for_traversal(branch_name=current_branch_name, graph=graph)
+        children_to_visit = _get_children_for_traversal(
+            branch_name=current_branch_name, graph=graph, child_to_parent=child_to_parent
+        )
 
         for child_name in children_to_visit:
             if child_name not in visited:
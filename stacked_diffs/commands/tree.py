@@ -1,5 +1,13 @@
+import sys
+from collections.abc import Sequence
+from itertools import chain
+
+from stacked_diffs.utils import git
 from stacked_diffs.utils.classes import Graph, TreeArgs
-from stacked_diffs.utils.metadata import MetadataManager
+from stacked_diffs.utils.metadata import get_metadata_manager
+
+# Shared empty default for branches without metadata; avoids allocating per node
+_NO_CHILDREN: tuple[str, ...] = ()
 
 
 def handle_tree(args: TreeArgs) -> None:
@@ -15,45 +23,57 @@ def handle_tree(args: TreeArgs) -> None:
         The parsed command-line arguments as a dataclass.
 
     """
-    mm = MetadataManager()
+    mm = get_metadata_manager()
     graph: Graph = mm.load_graph()
     trunk: str = graph.trunk
-    all_branches: set[str] = set(graph.branches.keys())
-    all_children: set[str] = set()
-
-    for branch_meta in graph.branches.values():
-        for child in branch_meta.children:
-            all_children.add(child)
+    all_children: set[str] = set(chain.from_iterable(meta.children for meta in graph.branches.values()))
 
-    root_branches: list[str] = sorted(list(all_branches - all_children))
+    root_branches: list[str] = sorted(graph.branches.keys() - all_children)
 
     if not root_branches:
         print(f"No stacks found to display. Your trunk branch is '{trunk}'.")
         return
 
-    print(f"'{trunk}' (Trunk)")
+    git.warn_if_cycle(graph)
+    lines: list[str] = [f"'{trunk}' (Trunk)"]
     root_count: int = len(root_branches)
     for i, root in enumerate(root_branches):
         is_root_last: bool = i == root_count - 1
-        print_branch_tree(branch=root, graph=graph, prefix="", is_last=is_root_last)
+        lines.extend(format_branch_tree(branch=root, graph=graph, prefix="", is_last=is_root_last))
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
-def print_branch_tree(
+def format_branch_tree(
     *,
     branch: str,
     graph: Graph,
     prefix: str = "",
     is_last: bool = True,
-) -> None:
-    """Recursively print a branch and its descendants in a tree structure."""
-    connector: str = "└── " if is_last else "├── "
-    print(f"{prefix}{connector}{branch}")
-    child_prefix: str = prefix + ("    " if is_last else "│   ")
-    children: list[str] = graph.branches.get(branch, {}).children
-    for i, child in enumerate(children):
-        print_branch_tree(
-            branch=child,
-            graph=graph,
-            prefix=child_prefix,
-            is_last=(i == len(children) - 1),
-        )
+) -> list[str]:
+    """Return the lines rendering a branch and its descendants in a tree structure."""
+    lines: list[str] = []
+    # Depth-first stack of (branch, prefix, is_last, depth); children are pushed in reverse to keep their order
+    stack: list[tuple[str, str, bool, int]] = [(branch, prefix, is_last, 0)]
+    # Branches from the starting branch down to the one being rendered, to break cycles in corrupt metadata
+    path: list[str] = []
+    on_path: set[str] = set()
+    while stack:
+        current, current_prefix, current_is_last, depth = stack.pop()
+        while len(path) > depth:
+            on_path.discard(path.pop())
+        connector: str = "└── " if current_is_last else "├── "
+        if current in on_path:
+            lines.append(f"{current_prefix}{connector}{current} (cycle)")
+            continue
+        lines.append(f"{current_prefix}{connector}{current}")
+        path.append(current)
+        on_path.add(current)
+        meta = graph.branches.get(current)
+        children: Sequence[str] = meta.children if meta is not None else _NO_CHILDREN
+        if not children:
+            continue
+        child_prefix: str = current_prefix + ("    " if current_is_last else "│   ")
+        last_index: int = len(children) - 1
+        for i in range(last_index, -1, -1):
+            stack.append((children[i], child_prefix, i == last_index, depth + 1))
+    return lines
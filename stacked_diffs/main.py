@@ -1,11 +1,10 @@
 import argparse
+import functools
+import re
 import sys
+from collections.abc import Callable
 
-from stacked_diffs.commands.add import handle_add
-from stacked_diffs.commands.alias import handle_alias
-from stacked_diffs.commands.prune import handle_prune
-from stacked_diffs.commands.run import handle_run
-from stacked_diffs.commands.tree import handle_tree
+from stacked_diffs.utils import git
 from stacked_diffs.utils.classes import (
     AddArgs,
     Alias,
@@ -14,17 +13,37 @@ from stacked_diffs.utils.classes import (
     RunArgs,
     TreeArgs,
 )
-from stacked_diffs.utils.default_aliases import DEFAULT_ALIASES
+from stacked_diffs.utils.default_aliases import DEFAULT_ALIASES_SORTED
 from stacked_diffs.utils.git import check_git_repo, check_git_state
-from stacked_diffs.utils.metadata import MetadataManager
+from stacked_diffs.utils.metadata import clear_metadata_managers, get_metadata_manager
 
-BUILT_IN_COMMANDS: list[str] = ["add", "run", "tree", "prune", "alias", "help"]
+# Well-formed alias KEY=VALUE argument: not a --flag, an ASCII name containing at least one
+# alphanumeric, and a value that isn't blank. Anything else takes the slower diagnostic checks.
+_ENV_ASSIGNMENT_RE = re.compile(r"\A(?!--)(?=[_-]*[A-Za-z0-9])([A-Za-z0-9_-]+)=(?=.*\S)(.*)\Z", re.DOTALL)
+
+BUILT_IN_COMMANDS: frozenset[str] = frozenset({"add", "run", "tree", "prune", "alias", "help"})
+_HELP_FLAGS: frozenset[str] = frozenset({"-h", "--help"})
+_CONTINUE_ABORT_FLAGS: frozenset[str] = frozenset({"--continue", "--abort"})
+# Read-only or config-only entry points that are safe while a rebase/merge is in progress.
+# Everything else, including aliases and prune, is checked.
+_STATE_INDEPENDENT_COMMANDS: frozenset[str] = frozenset({"tree", "alias"}) | _HELP_FLAGS
+
+
+def _format_alias_help_line(name: str, description: str) -> str:
+    return f"    {name:<18} {description}"
+
+
+# Built-in aliases never change at runtime, so their help lines are formatted once at import
+_DEFAULT_ALIAS_HELP_LINES: tuple[str, ...] = tuple(
+    _format_alias_help_line(name, a_def.description or f"Runs: sd run {a_def.command.run or '...'}")
+    for name, a_def in DEFAULT_ALIASES_SORTED
+)
 
 
 def _generate_aliases_help_string() -> str:
     """Generates a formatted string listing available aliases for help text."""
     if check_git_repo():
-        mm = MetadataManager()
+        mm = get_metadata_manager()
         user_aliases: dict[str, Alias] = mm.load_user_aliases()
     else:
         user_aliases = {}
@@ -32,15 +51,11 @@ def _generate_aliases_help_string() -> str:
     lines = []
     has_any_alias = False
 
-    if DEFAULT_ALIASES:
+    if _DEFAULT_ALIAS_HELP_LINES:
         if not lines:
             lines.append("Available Aliases (run with 'sd <alias_name>'):")
         lines.append("  --- Built-in ---")
-        for name, a_def in sorted(DEFAULT_ALIASES.items()):
-            desc = a_def.description
-            if not desc:
-                desc = f"Runs: sd run {a_def.command.run or '...'}"
-            lines.append(f"    {name:<18} {desc}")
+        lines.extend(_DEFAULT_ALIAS_HELP_LINES)
         has_any_alias = True
 
     if user_aliases:
@@ -51,27 +66,23 @@ def _generate_aliases_help_string() -> str:
             desc = alias_def.description
             if not desc:
                 desc = f"User alias: sd run {alias_def.command.run or '[No "run" command defined]'}"
-            lines.append(f"    {name:<18} {desc}")
+            lines.append(_format_alias_help_line(name, desc))
         has_any_alias = True
 
     return "\n" + "\n".join(lines) if has_any_alias else ""
 
 
-def build_parser() -> argparse.ArgumentParser:
-    """Builds and returns the main argument parser."""
-    aliases_help_epilog = _generate_aliases_help_string()
-    parser = argparse.ArgumentParser(
-        prog="sd",
-        description="A tool for managing stacked diffs.",
-        epilog=aliases_help_epilog,
-        formatter_class=argparse.RawTextHelpFormatter,
-    )
-    subparsers = parser.add_subparsers(dest="command", help="Sub-command help")
+def _build_add_parser(subparsers: argparse._SubParsersAction) -> None:
+    from stacked_diffs.commands.add import handle_add
 
     parser_add = subparsers.add_parser("add", help="Create a new branch stacked on top of the current branch.")
     parser_add.add_argument("branch_name", help="The name of the new branch to create.")
     parser_add.set_defaults(func=handle_add, args_class=AddArgs)
 
+
+def _build_run_parser(subparsers: argparse._SubParsersAction) -> None:
+    from stacked_diffs.commands.run import handle_run
+
     parser_run = subparsers.add_parser("run", help="Execute a shell command on the current branch and all descendants.")
     parser_run.add_argument("command_string", nargs="?", default=None, metavar="COMMAND")
     parser_run.add_argument(
@@ -95,12 +106,24 @@ def build_parser() -> argparse.ArgumentParser:
     continue_group.add_argument("--abort", nargs="?", const=True, dest="abort_run", help="Abort a paused run.")
     parser_run.set_defaults(func=handle_run, args_class=RunArgs)
 
+
+def _build_tree_parser(subparsers: argparse._SubParsersAction) -> None:
+    from stacked_diffs.commands.tree import handle_tree
+
     parser_tree = subparsers.add_parser("tree", help="Show all tracked branches in a tree structure.")
     parser_tree.set_defaults(func=handle_tree, args_class=TreeArgs)
 
+
+def _build_prune_parser(subparsers: argparse._SubParsersAction) -> None:
+    from stacked_diffs.commands.prune import handle_prune
+
     parser_prune = subparsers.add_parser("prune", help="Clean up fully merged branches from metadata and local repo.")
     parser_prune.set_defaults(func=handle_prune, args_class=PruneArgs)
 
+
+def _add_alias_subparser(subparsers: argparse._SubParsersAction) -> None:
+    from stacked_diffs.commands.alias import handle_alias
+
     parser_alias = subparsers.add_parser(
         "alias",
         help="Manage command aliases (use 'sd alias -h' for more options).",
@@ -108,77 +131,142 @@ def build_parser() -> argparse.ArgumentParser:
     )
     parser_alias.set_defaults(func=handle_alias, args_class=AliasArgs)
 
+
+# Subparser factories in help-listing order. Each one imports its handler lazily.
+_SUBPARSER_BUILDERS: dict[str, Callable[[argparse._SubParsersAction], None]] = {
+    "add": _build_add_parser,
+    "run": _build_run_parser,
+    "tree": _build_tree_parser,
+    "prune": _build_prune_parser,
+    "alias": _add_alias_subparser,
+}
+
+
+def _sniff_subcommand(argv: list[str]) -> str | None:
+    """Returns the built-in sub-command named in `argv`, or None if there isn't one."""
+    if argv and argv[0] in _SUBPARSER_BUILDERS:
+        return argv[0]
+    return None
+
+
+def _new_parser(epilog: str) -> tuple[argparse.ArgumentParser, argparse._SubParsersAction]:
+    """Creates the top-level `sd` parser and its sub-command group."""
+    parser = argparse.ArgumentParser(
+        prog="sd",
+        description="A tool for managing stacked diffs.",
+        epilog=epilog,
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    subparsers = parser.add_subparsers(dest="command", help="Sub-command help")
+    return parser, subparsers
+
+
+@functools.cache
+def _build_command_parser(command: str) -> argparse.ArgumentParser:
+    """
+    Builds the parser for a single built-in sub-command.
+
+    It has no alias epilog and parsing doesn't modify it, so it is built once
+    per process and reused by later main() calls.
+    """
+    parser, subparsers = _new_parser("")
+    _SUBPARSER_BUILDERS[command](subparsers)
+    return parser
+
+
+def build_parser(command: str | None = None) -> argparse.ArgumentParser:
+    """
+    Builds and returns the main argument parser.
+
+    If `command` names a built-in sub-command, only that subparser is built;
+    otherwise (help, unknown commands) all subparsers are built. The alias listing
+    in the epilog only appears in the full help, so it is only generated then.
+    """
+    if command in _SUBPARSER_BUILDERS:
+        return _build_command_parser(command)
+
+    # The epilog lists the user's aliases, which can change between calls, so this one isn't cached
+    parser, subparsers = _new_parser(_generate_aliases_help_string())
+    for build_subparser in _SUBPARSER_BUILDERS.values():
+        build_subparser(subparsers)
     return parser
 
 
-def main() -> None:
-    """The main entry point for the 'sd' CLI."""
-    parser = build_parser()
+def main(argv: list[str] | None = None) -> None:
+    """
+    The main entry point for the 'sd' CLI.
+
+    `argv` is the argument list without the program name; it defaults to sys.argv[1:].
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
+    # Start every invocation with a fresh view of HEAD and of the metadata files
+    git.clear_current_branch_cache()
+    clear_metadata_managers()
 
     if not check_git_repo():
         print("Please run sd from a git repository.\n\n")
-        parser.print_help(sys.stderr)
+        build_parser().print_help(sys.stderr)
         sys.exit(1)
 
     # Check if git is in a clean state (no active rebase, merge, etc.)
     # But allow continue/abort operations during active git operations
-    is_continue_abort = len(sys.argv) > 2 and (sys.argv[2] == "--continue" or sys.argv[2] == "--abort")
-    if not is_continue_abort:
+    # Commands that never touch the index or branches (tree, alias config, help) skip the check
+    is_continue_abort = len(argv) > 1 and argv[1] in _CONTINUE_ABORT_FLAGS
+    is_state_independent = bool(argv) and argv[0] in _STATE_INDEPENDENT_COMMANDS
+    if not is_continue_abort and not is_state_independent:
         check_git_state()
 
-    mm = MetadataManager()
-    all_aliases: dict[str, Alias] = mm.get_all_aliases()
-
     # --- Dynamic Alias Dispatch ---
-    # Check for aliases, but protect built-in commands from being overridden
-    if len(sys.argv) > 1 and sys.argv[1] not in BUILT_IN_COMMANDS and sys.argv[1] not in ["-h", "--help"]:
-        command_name: str = sys.argv[1]
+    # Check for aliases, but protect built-in commands from being overridden.
+    # Aliases are only loaded when the first argument could actually name one.
+    if argv and argv[0] not in BUILT_IN_COMMANDS and argv[0] not in _HELP_FLAGS:
+        command_name: str = argv[0]
+        mm = get_metadata_manager()
+        all_aliases: dict[str, Alias] = mm.get_all_aliases()
         if command_name in all_aliases:
             alias_def = all_aliases[command_name]
 
             cli_env_vars: dict[str, str] = {}
-            is_continue_abort_flow = False
-            raw_alias_args = sys.argv[2:]  # Arguments after the alias name
-
-            # Determine if this is a continue/abort flow for the alias.
-            # If so, CLI KEY=VALUE pairs are ignored; env vars come from saved state.
-            for arg_check in raw_alias_args:
-                if arg_check == "--continue" or arg_check == "--abort":
-                    is_continue_abort_flow = True
-                    break
-
-            if not is_continue_abort_flow:
-                for arg_val in raw_alias_args:
-                    # Parse KEY=VALUE pairs, avoid flags like --option=value
-                    if "=" in arg_val and not arg_val.startswith("--"):
-                        key, value = arg_val.split("=", 1)
-                        # Validate KEY=VALUE format
-                        if not key.strip():
-                            print(
-                                f"Error: Invalid environment variable format '{arg_val}': key cannot be empty",
-                                file=sys.stderr,
-                            )
-                            sys.exit(1)
-                        if not value.strip():
-                            print(
-                                f"Error: Invalid environment variable format '{arg_val}': value cannot be empty",
-                                file=sys.stderr,
-                            )
-                            sys.exit(1)
-                        if not key.replace("_", "").replace("-", "").isalnum():
-                            print(
-                                f"Error: Invalid environment variable name '{key}': must contain only alphanumeric characters, underscores, and hyphens",
-                                file=sys.stderr,
-                            )
-                            sys.exit(1)
+            flow_flag_indices: list[int] = []  # Positions of --continue/--abort
+            arg_error: str | None = None  # First invalid KEY=VALUE argument, if any
+            raw_alias_args = argv[1:]  # Arguments after the alias name
+
+            # Single pass: record continue/abort flags and parse KEY=VALUE pairs together.
+            # In a continue/abort flow, CLI KEY=VALUE pairs are ignored (env vars come from
+            # saved state), so validation errors are only reported once the scan is complete.
+            for idx, arg_val in enumerate(raw_alias_args):
+                if arg_val in _CONTINUE_ABORT_FLAGS:
+                    flow_flag_indices.append(idx)
+                    continue
+                if arg_error is not None:
+                    continue
+                # Fast path for well-formed KEY=VALUE pairs
+                env_match = _ENV_ASSIGNMENT_RE.match(arg_val)
+                if env_match:
+                    cli_env_vars[env_match[1]] = env_match[2]
+                    continue
+                # Parse remaining KEY=VALUE pairs, avoid flags like --option=value
+                if "=" in arg_val and not arg_val.startswith("--"):
+                    key, value = arg_val.split("=", 1)
+                    # Validate KEY=VALUE format
+                    if not key.strip():
+                        arg_error = f"Error: Invalid environment variable format '{arg_val}': key cannot be empty"
+                    elif not value.strip():
+                        arg_error = f"Error: Invalid environment variable format '{arg_val}': value cannot be empty"
+                    elif not key.replace("_", "").replace("-", "").isalnum():
+                        arg_error = f"Error: Invalid environment variable name '{key}': must contain only alphanumeric characters, underscores, and hyphens"
+                    else:
                         cli_env_vars[key] = value
-                    elif not arg_val.startswith("--") and not "=" in arg_val:
-                        # Non-flag argument without = is invalid for aliases
-                        print(
-                            f"Error: Invalid argument '{arg_val}': alias arguments must be in KEY=VALUE format or start with --",
-                            file=sys.stderr,
-                        )
-                        sys.exit(1)
+                elif not arg_val.startswith("--") and "=" not in arg_val:
+                    # Non-flag argument without = is invalid for aliases
+                    arg_error = f"Error: Invalid argument '{arg_val}': alias arguments must be in KEY=VALUE format or start with --"
+
+            is_continue_abort_flow = bool(flow_flag_indices)
+            if arg_error and not is_continue_abort_flow:
+                print(arg_error, file=sys.stderr)
+                sys.exit(1)
 
             # Construct arguments for the 'run' sub-parser
             run_parser_feed_args = ["run"]
@@ -196,22 +284,17 @@ def main() -> None:
 
             # Add --continue or --abort flags and their user-supplied optional values
             # These are passed from `sd alias_name [KEY=VAL...] --continue [remedy_cmd]`
-            idx = 0
-            while idx < len(raw_alias_args):
-                arg = raw_alias_args[idx]
-                if arg == "--continue" or arg == "--abort":
-                    run_parser_feed_args.append(arg)
-                    # Check for an optional value for --continue or --abort
-                    if (
-                        idx + 1 < len(raw_alias_args)
-                        and not raw_alias_args[idx + 1].startswith("--")
-                        and "=" not in raw_alias_args[idx + 1]
-                    ):
-                        run_parser_feed_args.append(raw_alias_args[idx + 1])
-                        idx += 1  # Consume the value
-                idx += 1
-
-            args = parser.parse_args(run_parser_feed_args)
+            for idx in flow_flag_indices:
+                run_parser_feed_args.append(raw_alias_args[idx])
+                # Check for an optional value for --continue or --abort
+                if (
+                    idx + 1 < len(raw_alias_args)
+                    and not raw_alias_args[idx + 1].startswith("--")
+                    and "=" not in raw_alias_args[idx + 1]
+                ):
+                    run_parser_feed_args.append(raw_alias_args[idx + 1])
+
+            args = build_parser("run").parse_args(run_parser_feed_args)
 
             run_args = RunArgs(
                 command_string=args.command_string,
@@ -223,27 +306,29 @@ def main() -> None:
                 command_name=command_name,
             )
 
-            handle_run(run_args, alias_def=alias_def)
+            args.func(run_args, alias_def=alias_def)
             return
 
     # --- Standard Command Parsing ---
-    if len(sys.argv) == 1:
+    parser = build_parser(_sniff_subcommand(argv))
+    if not argv:
         parser.print_help(sys.stderr)
         sys.exit(1)
 
     # Handle help flags explicitly - but let argparse handle it naturally
     # The explicit handling was interfering with normal argparse behavior
 
-    args, _ = parser.parse_known_args()
+    args, _ = parser.parse_known_args(argv)
 
     if not hasattr(args, "func"):
-        parser.error(f"unrecognized command: '{sys.argv[1]}'")
+        parser.error(f"unrecognized command: '{argv[0]}'")
 
     if args.command == "run":
+        # Reported through the full parser, whose usage line lists every sub-command
         if (args.continue_run or args.abort_run) and args.command_string:
-            parser.error("Cannot provide a COMMAND when using --continue or --abort.")
+            build_parser().error("Cannot provide a COMMAND when using --continue or --abort.")
         if not (args.continue_run or args.abort_run) and not args.command_string:
-            parser.error("A COMMAND is required for a new run operation.")
+            build_parser().error("A COMMAND is required for a new run operation.")
 
     # Create dataclass instance based on the command
     args_class = getattr(args, "args_class", None)
@@ -252,7 +337,7 @@ def main() -> None:
         if args.command == "alias":
             # handle_alias will parse its own arguments into the correct AliasArgs subclass
             # We just need to call it with the raw args for now.
-            args.func(args)
+            args.func(args, argv[1:])
         else:
             # Create dataclass instance, excluding 'func', 'command', and 'args_class'
             arg_dict = vars(args)
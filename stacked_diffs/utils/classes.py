@@ -1,19 +1,23 @@
 from dataclasses import dataclass, field
+from sys import intern
 from typing import Any
 
 
-@dataclass
+@dataclass(slots=True)
 class BranchMeta:
     children: list[str] = field(default_factory=list)
 
+    def to_dict(self) -> dict[str, Any]:
+        return {"children": list(self.children)}
+
 
 # Dataclasses for command arguments
-@dataclass
+@dataclass(slots=True)
 class AddArgs:
     branch_name: str
 
 
-@dataclass
+@dataclass(slots=True)
 class RunArgs:
     command_string: str | None = None
     pre_flight_cmd: str | None = None
@@ -24,23 +28,23 @@ class RunArgs:
     command_name: str = "run"
 
 
-@dataclass
+@dataclass(slots=True)
 class TreeArgs:
     pass  # No specific arguments
 
 
-@dataclass
+@dataclass(slots=True)
 class PruneArgs:
     pass  # No specific arguments
 
 
-@dataclass
+@dataclass(slots=True)
 class AliasArgs:
     # Base class for alias command arguments
     alias_command: str  # To distinguish subcommands
 
 
-@dataclass
+@dataclass(slots=True)
 class AliasSetArgs(AliasArgs):
     alias_name: str
     run: str
@@ -54,22 +58,22 @@ class AliasSetArgs(AliasArgs):
     env: list[str] | None = None  # Raw KEY=VALUE strings
 
 
-@dataclass
+@dataclass(slots=True)
 class AliasListArgs(AliasArgs):
     verbose: bool = False
 
 
-@dataclass
+@dataclass(slots=True)
 class AliasShowArgs(AliasArgs):
     alias_name: str
 
 
-@dataclass
+@dataclass(slots=True)
 class AliasRmArgs(AliasArgs):
     alias_name: str
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class CommandConfig:
     run: str | None = None
     descendants_only: bool = False
@@ -77,8 +81,18 @@ class CommandConfig:
     post_flight: str | None = None
     start_from_root: bool = False
 
+    def to_dict(self) -> dict[str, Any]:
+        # Keys in sorted order so .sd_aliases.json stays stable without json's sort_keys
+        return {
+            "descendants_only": self.descendants_only,
+            "post_flight": self.post_flight,
+            "pre_flight": self.pre_flight,
+            "run": self.run,
+            "start_from_root": self.start_from_root,
+        }
+
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Alias:
     description: str
     command: CommandConfig = field(default_factory=CommandConfig)
@@ -96,14 +110,27 @@ class Alias:
             env=alias_dict.get("env", {}),
         )
 
+    def to_dict(self) -> dict[str, Any]:
+        # Keys in sorted order so .sd_aliases.json stays stable without json's sort_keys
+        return {
+            "abort_cmd": self.abort_cmd,
+            "command": self.command.to_dict(),
+            "continue_cmd": self.continue_cmd,
+            "description": self.description,
+            "env": dict(sorted(self.env.items())),
+        }
+
 
-@dataclass
+@dataclass(slots=True)
 class PlanAction:
     branch: str
     parent: str
 
+    def to_dict(self) -> dict[str, Any]:
+        return {"branch": self.branch, "parent": self.parent}
 
-@dataclass
+
+@dataclass(slots=True)
 class ResumeState:
     operation: str
     start_branch: str
@@ -119,14 +146,25 @@ class ResumeState:
             operation=resume_state_dict.get("operation", ""),
             start_branch=resume_state_dict.get("start_branch", ""),
             user_command=resume_state_dict.get("user_command", ""),
-            plan=[PlanAction(**action) for action in resume_state_dict.get("plan", [])],
+            plan=[PlanAction(action["branch"], action["parent"]) for action in resume_state_dict.get("plan", [])],
             alias_name=resume_state_dict.get("alias_name", ""),
             env_vars=resume_state_dict.get("env_vars", {}),
             post_flight_cmd=resume_state_dict.get("post_flight_cmd"),
         )
 
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "operation": self.operation,
+            "start_branch": self.start_branch,
+            "user_command": self.user_command,
+            "plan": [action.to_dict() for action in self.plan],
+            "alias_name": self.alias_name,
+            "env_vars": dict(self.env_vars),
+            "post_flight_cmd": self.post_flight_cmd,
+        }
+
 
-@dataclass
+@dataclass(slots=True)
 class Graph:
     version: int
     trunk: str
@@ -141,7 +179,21 @@ class Graph:
         return cls(
             version=graph_dict.get("version", 0),
             trunk=graph_dict.get("trunk", ""),
-            branches={k: BranchMeta(**v) for k, v in graph_dict.get("branches", {}).items()},
+            # Each name appears as a key and again in its parent's children; interning makes those
+            # one object, so the membership tests and index lookups of traversals compare by identity
+            branches={
+                intern(k): BranchMeta([intern(c) for c in v.get("children", [])])
+                for k, v in graph_dict.get("branches", {}).items()
+            },
             resume_state=resume_state_obj,
-            aliases=graph_dict.get("aliases", {}),
+            aliases={k: Alias.from_dict(v) for k, v in graph_dict.get("aliases", {}).items()},
         )
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "version": self.version,
+            "trunk": self.trunk,
+            "branches": {name: meta.to_dict() for name, meta in self.branches.items()},
+            "resume_state": self.resume_state.to_dict() if self.resume_state else None,
+            "aliases": {name: alias.to_dict() for name, alias in self.aliases.items()},
+        }
@@ -24,3 +24,6 @@ DEFAULT_ALIASES: dict[str, Alias] = {
         abort_cmd="git rebase --abort",
     ),
 }
+
+# Sorted once at import; the built-ins never change at runtime
+DEFAULT_ALIASES_SORTED: tuple[tuple[str, Alias], ...] = tuple(sorted(DEFAULT_ALIASES.items()))
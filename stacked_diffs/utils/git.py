@@ -1,4 +1,5 @@
 import os
+import shutil
 import subprocess
 import sys
 from pathlib import Path
@@ -6,27 +7,132 @@ from pathlib import Path
 from stacked_diffs.utils.classes import Graph
 from stacked_diffs.utils.util import run_command
 
-GIT_EXECUTABLE = os.environ.get("SD_GIT_EXECUTABLE", "git")
+# Resolved to an absolute path once so each spawn skips the PATH search.
+# Falls back to the configured value so a missing executable is still reported by name.
+_CONFIGURED_GIT_EXECUTABLE = os.environ.get("SD_GIT_EXECUTABLE", "git")
+GIT_EXECUTABLE = shutil.which(_CONFIGURED_GIT_EXECUTABLE) or _CONFIGURED_GIT_EXECUTABLE
+
+# (work tree root, git dir) per working directory, filled by _probe_git.
+# Only successful probes are cached, so a repository created later is still found.
+_repo_probe_cache: dict[str, tuple[Path, Path]] = {}
+
+
+def _probe_git() -> tuple[Path, Path] | None:
+    """
+    Finds the work tree root and git directory for the current directory with a
+    single `git rev-parse` call. Returns None when not inside a git work tree.
+    """
+    cwd = os.getcwd()
+    cached = _repo_probe_cache.get(cwd)
+    if cached is not None:
+        return cached
+
+    result = subprocess.run(
+        [GIT_EXECUTABLE, "rev-parse", "--show-toplevel", "--absolute-git-dir"],
+        capture_output=True,
+        text=True,
+    )
+    lines = result.stdout.splitlines()
+    if result.returncode != 0 or len(lines) < 2:
+        return None
+
+    probe = (Path(lines[0]), Path(lines[1]))
+    _repo_probe_cache[cwd] = probe
+    return probe
 
 
 def get_git_root() -> Path:
     """Finds the root of the git repository."""
-    path = run_command([GIT_EXECUTABLE, "rev-parse", "--show-toplevel"])
-    return Path(path)
+    probe = _probe_git()
+    if probe is None:
+        print("Error: Not inside a git work tree.", file=sys.stderr)
+        sys.exit(1)
+    return probe[0]
+
+
+# Request-scoped cache of the checked-out branch. Anything that may move HEAD must
+# go through checkout_branch/create_branch or call clear_current_branch_cache().
+_current_branch_cache: str | None = None
 
 
 def get_current_branch() -> str:
     """Gets the current active branch name."""
-    return run_command([GIT_EXECUTABLE, "rev-parse", "--abbrev-ref", "HEAD"])
+    global _current_branch_cache
+    if _current_branch_cache is None:
+        _current_branch_cache = _read_head_branch() or run_command(
+            [GIT_EXECUTABLE, "rev-parse", "--abbrev-ref", "HEAD"]
+        )
+    return _current_branch_cache
+
+
+# Prefix of the HEAD file when a branch is checked out
+_HEAD_BRANCH_PREFIX = "ref: refs/heads/"
+
+
+def _read_head_branch() -> str | None:
+    """
+    Reads the checked-out branch, or "HEAD" when detached, straight from the HEAD file
+    of the current worktree's git dir. Returns None when the file can't be interpreted
+    that way, so the caller asks git instead.
+    """
+    probe = _probe_git()
+    if probe is None:
+        return None
+    try:
+        head = (probe[1] / "HEAD").read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+    if head.startswith(_HEAD_BRANCH_PREFIX):
+        branch = head[len(_HEAD_BRANCH_PREFIX) :]
+        # Reftable repositories keep a placeholder HEAD file pointing at "refs/heads/.invalid"
+        return branch if branch != ".invalid" else None
+    if not head.startswith("ref:"):
+        # A detached HEAD holds the commit hash; match `rev-parse --abbrev-ref HEAD`
+        return "HEAD"
+    return None
+
+
+def clear_current_branch_cache() -> None:
+    """Forgets the cached current branch, e.g. after running an arbitrary shell command."""
+    global _current_branch_cache
+    _current_branch_cache = None
+
+
+def checkout_branch(branch_name: str) -> None:
+    """Checks out an existing branch."""
+    global _current_branch_cache
+    _current_branch_cache = None
+    run_command([GIT_EXECUTABLE, "checkout", branch_name])
+    _current_branch_cache = branch_name
 
 
 def create_branch(branch_name: str, base_branch: str) -> None:
     """Creates a new branch based on a base branch."""
+    global _current_branch_cache
+    _current_branch_cache = None
     run_command([GIT_EXECUTABLE, "checkout", "-b", branch_name, base_branch])
+    _current_branch_cache = branch_name
+
+
+def build_parent_index(graph: Graph) -> dict[str, str]:
+    """Map each tracked child branch to its parent in a single pass over the graph."""
+    child_to_parent: dict[str, str] = {}
+    for parent, meta in graph.branches.items():
+        for child in meta.children:
+            # Keep the first parent seen, matching find_parent's scan order
+            child_to_parent.setdefault(child, parent)
+    return child_to_parent
 
 
-def find_parent(branch_name: str, graph: Graph) -> str | None:
-    """Finds the parent of a given branch in the metadata graph."""
+def find_parent(branch_name: str, graph: Graph, parent_index: dict[str, str] | None = None) -> str | None:
+    """
+    Finds the parent of a given branch in the metadata graph.
+
+    Callers doing repeated lookups should pass an index from `build_parent_index`;
+    without one, the graph is scanned.
+    """
+    if parent_index is not None:
+        return parent_index.get(branch_name)
     for parent, meta in graph.branches.items():
         if branch_name in meta.children:
             return parent
@@ -35,8 +141,9 @@ def find_parent(branch_name: str, graph: Graph) -> str | None:
 
 def get_local_branches() -> set[str]:
     """Returns a set of all local branch names."""
-    output = run_command([GIT_EXECUTABLE, "branch"])
-    return {line.strip().replace("* ", "") for line in output.splitlines()}
+    # Plumbing output: one bare name per line, no '*'/'+' markers or detached-HEAD entries
+    output = run_command([GIT_EXECUTABLE, "for-each-ref", "--format=%(refname:short)", "refs/heads/"])
+    return set(output.splitlines())
 
 
 def get_merged_branches(trunk_branch: str) -> set[str]:
@@ -44,11 +151,13 @@ def get_merged_branches(trunk_branch: str) -> set[str]:
     # Ensure our remote refs are up to date
     run_command([GIT_EXECUTABLE, "fetch", "origin"])
     # Ensure our local trunk is up to date
-    run_command([GIT_EXECUTABLE, "checkout", trunk_branch])
+    checkout_branch(trunk_branch)
     run_command([GIT_EXECUTABLE, "reset", "--hard", f"origin/{trunk_branch}"])
 
-    output = run_command([GIT_EXECUTABLE, "branch", "--merged", trunk_branch])
-    return {line.strip().replace("* ", "") for line in output.splitlines()}
+    output = run_command(
+        [GIT_EXECUTABLE, "for-each-ref", "--merged", trunk_branch, "--format=%(refname:short)", "refs/heads/"]
+    )
+    return set(output.splitlines())
 
 
 def delete_local_branches(branches: list[str]) -> None:
@@ -96,57 +205,106 @@ def find_stack_root(branch_name: str, graph: Graph) -> str:
     if branch_name == trunk or branch_name not in graph.branches:
         return branch_name
 
+    parent_index = build_parent_index(graph)
     current_branch_in_stack = branch_name
+    # Guards against cycles in corrupt metadata, which would otherwise never reach the trunk
+    seen: set[str] = {branch_name}
     while True:
-        parent = find_parent(current_branch_in_stack, graph)
-        if parent is None or parent == trunk:
+        parent = find_parent(current_branch_in_stack, graph, parent_index)
+        if parent is None or parent == trunk or parent in seen:
             return current_branch_in_stack
         # Parent is another stacked branch, continue traversing up
+        seen.add(parent)
         current_branch_in_stack = parent
 
 
-def check_git_repo() -> bool:
-    """Checks if the current directory is a Git repository.
-    Raises a RuntimeError if not in a Git repository.
+def find_cycle(graph: Graph) -> list[str]:
     """
-    try:
-        subprocess.run(
-            [GIT_EXECUTABLE, "rev-parse", "--is-inside-work-tree"],
-            check=True,
-            capture_output=True,
-            text=True,
+    Finds a cycle in the parent/child links of the metadata graph.
+
+    Returns the cycle as a path that starts and ends on the same branch
+    (e.g. ['A', 'B', 'A']), or an empty list if the graph has none.
+    """
+    # Branches whose descendants have all been explored without finding a cycle
+    done: set[str] = set()
+    for root in graph.branches:
+        if root in done:
+            continue
+        # Iterative DFS: the current path, its members, and a children iterator per path entry
+        path: list[str] = [root]
+        on_path: set[str] = {root}
+        child_iters = [iter(graph.branches[root].children)]
+        while child_iters:
+            child = next(child_iters[-1], None)
+            if child is None:
+                finished = path.pop()
+                on_path.discard(finished)
+                done.add(finished)
+                child_iters.pop()
+                continue
+            if child in on_path:
+                return [*path[path.index(child) :], child]
+            if child in done:
+                continue
+            path.append(child)
+            on_path.add(child)
+            meta = graph.branches.get(child)
+            child_iters.append(iter(meta.children if meta is not None else ()))
+    return []
+
+
+def warn_if_cycle(graph: Graph) -> None:
+    """Prints a warning if the metadata graph contains a cycle; traversals skip the link that closes it."""
+    cycle = find_cycle(graph)
+    if cycle:
+        print(
+            f"Warning: Branch metadata contains a cycle: {' -> '.join(cycle)}. "
+            "The link that closes it will be skipped.",
+            file=sys.stderr,
         )
-        return True
-    except subprocess.CalledProcessError:
-        return False
+
+
+def check_git_repo() -> bool:
+    """Checks if the current directory is inside a Git work tree."""
+    return _probe_git() is not None
 
 
 def check_git_state() -> None:
     """Check if git is in a clean state (no active rebase, merge, etc.).
     Raises SystemExit if git is in an unclean state.
     """
-    git_dir = get_git_root() / ".git"
+    probe = _probe_git()
+    if probe is None:
+        return
+    # Use git's own answer for the git dir, which also covers worktrees
+    git_dir = probe[1]
+
+    # List the git dir once and test membership, instead of one stat per marker file
+    try:
+        git_dir_entries: set[str] = set(os.listdir(git_dir))
+    except FileNotFoundError:
+        return
 
     # Check for active rebase
-    if (git_dir / "rebase-merge").exists() or (git_dir / "rebase-apply").exists():
+    if "rebase-merge" in git_dir_entries or "rebase-apply" in git_dir_entries:
         print("Error: Git is currently in the middle of a rebase operation.", file=sys.stderr)
         print("Please complete or abort the rebase before running sd commands.", file=sys.stderr)
         sys.exit(1)
 
     # Check for active merge
-    if (git_dir / "MERGE_HEAD").exists():
+    if "MERGE_HEAD" in git_dir_entries:
         print("Error: Git is currently in the middle of a merge operation.", file=sys.stderr)
         print("Please complete or abort the merge before running sd commands.", file=sys.stderr)
         sys.exit(1)
 
     # Check for active cherry-pick
-    if (git_dir / "CHERRY_PICK_HEAD").exists():
+    if "CHERRY_PICK_HEAD" in git_dir_entries:
         print("Error: Git is currently in the middle of a cherry-pick operation.", file=sys.stderr)
         print("Please complete or abort the cherry-pick before running sd commands.", file=sys.stderr)
         sys.exit(1)
 
     # Check for active revert
-    if (git_dir / "REVERT_HEAD").exists():
+    if "REVERT_HEAD" in git_dir_entries:
         print("Error: Git is currently in the middle of a revert operation.", file=sys.stderr)
         print("Please complete or abort the revert before running sd commands.", file=sys.stderr)
         sys.exit(1)
@@ -1,12 +1,15 @@
 import json
+import os
 import sys
-from dataclasses import asdict
 from pathlib import Path
 
 from stacked_diffs.utils import git
 from stacked_diffs.utils.classes import Alias, Graph, ResumeState
 from stacked_diffs.utils.default_aliases import DEFAULT_ALIASES
 
+# (inode, mtime_ns, size) of a metadata file, used to tell whether a cached parse is still current
+StatKey = tuple[int, int, int]
+
 
 class MetadataManager:
     """Manages all file-based state for the tool."""
@@ -15,11 +18,57 @@ class MetadataManager:
         self.git_root: Path = git.get_git_root()
         self.graph_path: Path = self.git_root / ".git" / "stacked_diffs_graph.json"
         self.user_alias_path: Path = self.git_root / ".sd_aliases.json"
+        # Parsed file contents are memoized per instance together with the file's stat signature,
+        # so that writes made by other processes or instances are still picked up.
+        self._graph_cache: tuple[StatKey, Graph] | None = None
+        self._user_alias_cache: tuple[StatKey, dict[str, Alias]] | None = None
+
+    @staticmethod
+    def _to_stat_key(st: os.stat_result) -> StatKey:
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    @classmethod
+    def _stat_key(cls, path: Path) -> StatKey | None:
+        """Returns the stat signature for a file, or None if it doesn't exist."""
+        try:
+            return cls._to_stat_key(path.stat())
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def _atomic_write(cls, path: Path, payload: bytes) -> StatKey:
+        """
+        Writes `payload` to a sibling temp file and renames it over `path`, so readers
+        never see a partially written file. Returns the stat signature of the new file.
+        """
+        # Write next to a symlink's target, so the rename replaces the target and keeps the link
+        path = path.resolve()
+        # Per-process temp name: concurrent sd processes must not write into each other's temp file
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            existing_mode = os.stat(path).st_mode & 0o7777
+        except FileNotFoundError:
+            existing_mode = None
+        try:
+            with open(tmp_path, "wb") as f:
+                if existing_mode is not None:
+                    # Keep the permissions of the file being replaced
+                    os.fchmod(f.fileno(), existing_mode)
+                f.write(payload)
+                f.flush()
+                # The rename keeps the inode and mtime, so this is also the signature of `path`
+                stat_key = cls._to_stat_key(os.fstat(f.fileno()))
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        return stat_key
 
     # --- Graph Management ---
     def load_graph(self) -> Graph:
         """Loads the metadata from the file, returning a default if it doesn't exist."""
-        if not self.graph_path.exists():
+        stat_key = self._stat_key(self.graph_path)
+        if stat_key is None:
             return Graph(
                 version=3,
                 trunk="main",
@@ -27,14 +76,18 @@ class MetadataManager:
                 resume_state=None,
                 aliases={},
             )
+        if self._graph_cache is not None and self._graph_cache[0] == stat_key:
+            return self._graph_cache[1]
+        graph = self._read_graph()
+        self._graph_cache = (stat_key, graph)
+        return graph
+
+    def _read_graph(self) -> Graph:
+        """Parses the metadata file."""
         try:
-            with open(self.graph_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                # Convert alias dicts to Alias dataclass instances
-                if "aliases" in data:
-                    data["aliases"] = {k: Alias(**v) for k, v in data["aliases"].items()}
-                return Graph.from_dict(data)
-        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            # Read the whole file in one call; json.loads decodes UTF-8 bytes directly
+            return Graph.from_dict(json.loads(self.graph_path.read_bytes()))
+        except (json.JSONDecodeError, UnicodeDecodeError, KeyError, TypeError, AttributeError) as e:
             print(f"Error: Corrupted metadata file '{self.graph_path}': {e}", file=sys.stderr)
             print("The metadata file will be backed up and recreated.", file=sys.stderr)
             # Backup corrupted file
@@ -45,9 +98,9 @@ class MetadataManager:
 
     def save_graph(self, data: Graph) -> None:
         """Saves the metadata to the file."""
-        # Convert dataclass to dict for JSON serialization
-        with open(self.graph_path, "w", encoding="utf-8") as f:
-            json.dump(asdict(data), f, indent=2)
+        payload = json.dumps(data.to_dict(), indent=2).encode("utf-8")
+        # The saved graph is now the current parse of the file; remember it for later loads
+        self._graph_cache = (self._atomic_write(self.graph_path, payload), data)
 
     def get_resume_state(self) -> ResumeState | None:
         graph = self.load_graph()
@@ -67,8 +120,17 @@ class MetadataManager:
     # --- Alias Management ---
     def load_user_aliases(self) -> dict[str, Alias]:
         """Loads aliases from the user-facing .sd_aliases.json file."""
-        if not self.user_alias_path.exists():
+        stat_key = self._stat_key(self.user_alias_path)
+        if stat_key is None:
             return {}
+        if self._user_alias_cache is not None and self._user_alias_cache[0] == stat_key:
+            return self._user_alias_cache[1]
+        aliases = self._read_user_aliases()
+        self._user_alias_cache = (stat_key, aliases)
+        return aliases
+
+    def _read_user_aliases(self) -> dict[str, Alias]:
+        """Parses the user alias file."""
         try:
             with open(self.user_alias_path, "r", encoding="utf-8") as f:
                 return {k: Alias.from_dict(v) for k, v in json.load(f).items()}
@@ -81,11 +143,32 @@ class MetadataManager:
 
     def save_user_aliases(self, aliases: dict[str, Alias]) -> None:
         """Saves aliases to the user-facing .sd_aliases.json file."""
-        with open(self.user_alias_path, "w", encoding="utf-8") as f:
-            json.dump(aliases, f, indent=2, sort_keys=True)
+        # Only the top level needs sorting; Alias.to_dict already emits its keys in order
+        ordered = {name: aliases[name].to_dict() for name in sorted(aliases)}
+        payload = json.dumps(ordered, indent=2).encode("utf-8")
+        self._user_alias_cache = (self._atomic_write(self.user_alias_path, payload), aliases)
 
     def get_all_aliases(self) -> dict[str, Alias]:
         """Returns a merged dictionary of default and user aliases."""
         user_aliases = self.load_user_aliases()
         # User aliases take precedence over defaults
         return {**DEFAULT_ALIASES, **user_aliases}
+
+
+# MetadataManager per working directory, shared by everything one sd command does.
+# main() clears it at the start of each command, like the current-branch cache.
+_managers: dict[str, MetadataManager] = {}
+
+
+def get_metadata_manager() -> MetadataManager:
+    """Returns the MetadataManager for the current directory, creating it on first use."""
+    cwd = os.getcwd()
+    mm = _managers.get(cwd)
+    if mm is None:
+        mm = _managers[cwd] = MetadataManager()
+    return mm
+
+
+def clear_metadata_managers() -> None:
+    """Forgets the shared MetadataManagers, so the next command starts from fresh caches."""
+    _managers.clear()
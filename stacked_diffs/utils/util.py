@@ -1,6 +1,11 @@
+import functools
 import os
+import re
+import shlex
+import shutil
 import subprocess
 import sys
+from collections.abc import Callable
 
 
 def run_command(
@@ -8,10 +13,8 @@ def run_command(
     env_vars: dict | None = None,
 ) -> str:
     """A helper to run a command and return its stdout, with an optional custom environment."""
-    # Combine the custom environment with the existing environment
-    env = os.environ.copy()
-    if env_vars:
-        env.update(env_vars)
+    # Overlay custom variables on the current environment; with none, let the child inherit it as-is
+    env = {**os.environ, **env_vars} if env_vars else None
 
     try:
         result = subprocess.run(
@@ -39,26 +42,132 @@ def run_command(
         sys.exit(1)
 
 
+# Exit status a setup command reports so its failure can be told apart from the user command's
+SETUP_FAILED_EXIT_CODE = 97
+
+# Characters that make a command need a shell: operators, redirections, quoting, globs,
+# comments, assignments, brace/tilde expansion and any `$` that isn't a plain variable reference.
+_SHELL_METACHARS = re.compile(r"[|&;<>()`\\\"'*?\[\]#~={}!$\n]")
+# A plain `$NAME` or `${NAME}` reference
+_VAR_REF = re.compile(r"\$(?:([A-Za-z_][A-Za-z0-9_]*)|\{([A-Za-z_][A-Za-z0-9_]*)\})")
+# The shell's default field separators within a line; other whitespace is part of a word
+_WORD_SEPARATORS = re.compile(r"[ \t]+")
+# Values the shell would split or glob after expanding them unquoted
+_UNSAFE_VALUE_CHARS = frozenset(" \t\n*?[")
+# POSIX special and regular built-ins. Several also exist on PATH (echo, printf, test, kill,
+# ...) but behave differently there, so commands naming them always go through the shell.
+_SHELL_BUILTINS = frozenset().union(
+    # Special built-ins
+    (".", ":", "break", "continue", "eval", "exec", "exit", "export", "readonly", "return", "set", "shift"),
+    ("times", "trap", "unset"),
+    # Regular built-ins
+    ("alias", "bg", "cd", "command", "echo", "false", "fc", "fg", "getopts", "hash", "jobs", "kill", "local"),
+    ("printf", "pwd", "read", "test", "[", "true", "type", "ulimit", "umask", "unalias", "wait"),
+)
+
+
+@functools.lru_cache(maxsize=128)
+def _parse_simple_command(command: str) -> tuple[tuple[str, ...], ...] | None:
+    """
+    Splits a command made only of plain words and `$NAME`/`${NAME}` references into its words,
+    or returns None if it needs a shell.
+
+    Each word is a tuple alternating literal text (even indices) and variable names (odd
+    indices). The parse doesn't depend on the environment, so `sd run` parses its command
+    once and only substitutes the per-branch values.
+    """
+    if _SHELL_METACHARS.search(_VAR_REF.sub("", command)):
+        return None
+    command = command.strip(" \t")
+    if not command:
+        return None
+    words: list[tuple[str, ...]] = []
+    for word in _WORD_SEPARATORS.split(command):
+        parts: list[str] = []
+        pos = 0
+        for match in _VAR_REF.finditer(word):
+            parts += (word[pos : match.start()], match.group(1) or match.group(2))
+            pos = match.end()
+        parts.append(word[pos:])
+        words.append(tuple(parts))
+    return tuple(words)
+
+
+def _split_simple_command(command: str, env: dict[str, str]) -> tuple[str, list[str]] | None:
+    """
+    Returns the executable and argv the shell would run for `command`, or None if running it
+    needs a shell. argv[0] stays as typed, as the shell passes it.
+
+    Only commands made of plain words and `$NAME`/`${NAME}` references qualify, and only
+    when every referenced variable is set to a value the shell wouldn't split, glob or drop.
+    The program must also be an executable on PATH that isn't a shell builtin, so `cd` or
+    `echo` still go through the shell.
+    """
+    words = _parse_simple_command(command)
+    if words is None:
+        return None
+    argv: list[str] = []
+    for parts in words:
+        pieces = list(parts)
+        for i in range(1, len(pieces), 2):
+            value = env.get(pieces[i])
+            if not value or not _UNSAFE_VALUE_CHARS.isdisjoint(value):
+                return None
+            pieces[i] = value
+        argv.append("".join(pieces))
+    if argv[0] in _SHELL_BUILTINS:
+        return None
+    executable = shutil.which(argv[0], path=env.get("PATH"))
+    if executable is None:
+        return None
+    return executable, argv
+
+
 def run_shell_command(
     command: str,
     env_vars: dict | None = None,
     fail_on_error: bool = False,
+    setup_command: list[str] | None = None,
+    setup_succeeded: Callable[[], bool] | None = None,
 ) -> bool:
     """
     Runs a user-provided shell command string.
     Returns True on success, False on failure.
     If fail_on_error is True, exits the program on command failure.
+    If setup_command is given, it runs first; if it fails, the command is skipped and the
+    program exits, as a failed internal step would. Through the shell, a failed setup is
+    reported by exit status SETUP_FAILED_EXIT_CODE, which the command itself may also use;
+    setup_succeeded, if given, is then asked whether the setup actually took effect.
+    Simple commands are run directly rather than through /bin/sh, saving a process per call.
     """
-    current_branch_for_prompt = env_vars.get("SD_CURRENT_BRANCH", "shell")
+    current_branch_for_prompt = (env_vars or {}).get("SD_CURRENT_BRANCH", "shell")
     print(f"[{current_branch_for_prompt}]> {command}")
 
-    env = os.environ.copy()
-    if env_vars:
-        env.update(env_vars)
+    env = {**os.environ, **env_vars} if env_vars else None
 
+    simple_command = _split_simple_command(command, env or dict(os.environ))
     try:
+        if simple_command is not None:
+            executable, argv = simple_command
+            if setup_command and subprocess.run(setup_command, env=env).returncode != 0:
+                print(f"Error running command: {shlex.join(setup_command)}", file=sys.stderr)
+                sys.exit(1)
+            try:
+                subprocess.run(argv, executable=executable, check=True, env=env)
+                return True
+            except OSError:
+                # e.g. ENOEXEC for a script without a shebang, which /bin/sh runs as a shell
+                # script. The setup has already run, so only the command is left to the shell.
+                simple_command = None
+                setup_command = None
+
+        script = command
+        if setup_command:
+            # Run the setup in the same shell process, on a separate line (rather than
+            # '&&') so the guard also covers multi-statement commands
+            script = f"{shlex.join(setup_command)} || exit {SETUP_FAILED_EXIT_CODE}\n{command}"
         subprocess.run(
-            command,
+            script,
             text=True,
             check=True,
             encoding="utf-8",
@@ -67,6 +176,15 @@ def run_shell_command(
         )
         return True
     except subprocess.CalledProcessError as e:
+        # Only the shell path reports a failed setup through the exit status
+        if (
+            simple_command is None
+            and setup_command
+            and e.returncode == SETUP_FAILED_EXIT_CODE
+            and not (setup_succeeded and setup_succeeded())
+        ):
+            print(f"Error running command: {shlex.join(setup_command)}", file=sys.stderr)
+            sys.exit(1)
         print(f"Error running command: {command}", file=sys.stderr)
         print(f"Exit Code: {e.returncode}", file=sys.stderr)
         if fail_on_error:
@@ -1,79 +1,257 @@
 import os
+import shutil
 import tempfile
-from collections.abc import Generator
+from collections.abc import Callable, Generator
 from pathlib import Path
 from typing import Any
 
 import pytest
 
-from tests.utils import run_git_command
+from stacked_diffs import main as sd_main
+from stacked_diffs.utils import git
+from stacked_diffs.utils.metadata import MetadataManager, clear_metadata_managers
+from tests.utils import close_cat_files, run_git_batch, run_git_command, run_sd_command
+
+# Remotes configured on the local test repository, all pointing at the same "remote" repo
+TEST_REMOTES = ("origin", "another_remote", "upstream")
+
+# Memory-backed filesystem used for the test repositories when available
+TMPFS_DIR = Path("/dev/shm")
+
+# Global git config for the test run. Test repositories are thrown away, so git
+# doesn't need to fsync, sign, garbage-collect or run hooks for them, or print advice.
+TEST_GIT_CONFIG = """\
+[init]
+\tdefaultBranch = main
+[core]
+\tfsync = none
+\thooksPath = /dev/null
+[commit]
+\tgpgSign = false
+[tag]
+\tgpgSign = false
+[gc]
+\tauto = 0
+[advice]
+\tdetachedHead = false
+\tskippedCherryPicks = false
+"""
+
+_tmpfs_basetemp_key = pytest.StashKey[Path]()
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    """Places pytest's temporary directories on tmpfs unless --basetemp was given."""
+    # xdist workers are handed a subdirectory of the controller's basetemp
+    if config.option.basetemp or hasattr(config, "workerinput"):
+        return
+    if not (TMPFS_DIR.is_dir() and os.access(TMPFS_DIR, os.W_OK)):
+        return
+    basetemp = Path(tempfile.mkdtemp(prefix="sd-tests-", dir=TMPFS_DIR))
+    config.option.basetemp = str(basetemp)
+    config.stash[_tmpfs_basetemp_key] = basetemp
+
+
+def pytest_unconfigure(config: pytest.Config) -> None:
+    # tmpfs is backed by memory, so don't leave test repositories behind
+    basetemp = config.stash.get(_tmpfs_basetemp_key, None)
+    if basetemp is not None:
+        shutil.rmtree(basetemp, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def _reset_git_caches() -> None:
+    """
+    Clears sd's module-level git and metadata caches before each test.
+
+    run_sd_command calls sd's entry point in this process, so the repository
+    probe, current-branch and shared MetadataManager caches would otherwise
+    carry over between tests.
+    """
+    git._repo_probe_cache.clear()
+    git.clear_current_branch_cache()
+    clear_metadata_managers()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _prewarm_sd() -> None:
+    """
+    Builds sd's cached sub-command parsers once per session (and per xdist worker).
+
+    Building them imports every command handler, so that cost isn't charged to
+    whichever test happens to run a command first.
+    """
+    for command in sd_main._SUBPARSER_BUILDERS:
+        sd_main.build_parser(command)
+
+
+@pytest.fixture(scope="session")
+def _git_config(tmp_path_factory: pytest.TempPathFactory) -> Generator[Path, Any, None]:
+    """
+    Points GIT_CONFIG_GLOBAL at TEST_GIT_CONFIG for the whole session.
+
+    The system config is skipped as well, so no git invocation reads or depends on
+    the machine's settings, and git doesn't take optional locks (e.g. to refresh
+    the index during `git status`).
+    """
+    config_path = tmp_path_factory.mktemp("git-config") / "gitconfig"
+    config_path.write_text(TEST_GIT_CONFIG)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("GIT_CONFIG_GLOBAL", str(config_path))
+        mp.setenv("GIT_CONFIG_NOSYSTEM", "1")
+        mp.setenv("GIT_OPTIONAL_LOCKS", "0")
+        yield config_path
+
+
+@pytest.fixture(scope="session")
+def _git_repo_template(_git_config: Path, tmp_path_factory: pytest.TempPathFactory) -> Path:
+    """
+    Builds the canonical test repository layout once per session.
+
+    The layout is a local repository on `main` containing a "remote" non-bare
+    repository in `remote/`, configured as every entry in TEST_REMOTES. Each test
+    gets its own copy of it through the `git_repo` fixture.
+    """
+    repo_path = tmp_path_factory.mktemp("template")
+
+    # 1. Create a non-bare repository to act as the remote "origin", configured to accept
+    # pushes, with an initial commit
+    remote_path = repo_path / "remote"
+    remote_path.mkdir()
+    (remote_path / "initial.txt").write_text("initial commit")
+    run_git_batch(
+        [
+            ["init", "-b", "main"],
+            ["config", "receive.denyCurrentBranch", "updateInstead"],
+            ["config", "user.name", "Remote User"],
+            ["config", "user.email", "remote@example.com"],
+            ["add", "initial.txt"],
+            ["commit", "-m", "Initial commit"],
+        ],
+        cwd=remote_path,
+    )
+
+    # 2. Initialize the local repository and add the non-bare repository as the 'origin'
+    # remote, plus 'another_remote' for testing custom remote env vars and 'upstream' for
+    # sync tests. Then fetch the initial commit and point `main` at it to establish the
+    # connection; unlike `git pull`, this skips the merge machinery on the unborn branch.
+    run_git_batch(
+        [
+            ["init", "-b", "main"],
+            ["config", "user.name", "Test User"],
+            ["config", "user.email", "test@example.com"],
+            *(["remote", "add", remote, str(remote_path)] for remote in TEST_REMOTES),
+            ["fetch", "origin", "main"],
+            ["reset", "--hard", "origin/main"],
+        ],
+        cwd=repo_path,
+    )
+
+    return repo_path
+
+
+# Path fragment of files in a git object store. Git never modifies these in place,
+# so copies of a repository can share them.
+_OBJECT_STORE_PART = f"{os.sep}.git{os.sep}objects{os.sep}"
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    """copytree copy function that hardlinks git objects and copies everything else."""
+    if _OBJECT_STORE_PART in src:
+        if os.path.exists(dst):
+            # Object files are named by their content, so an existing one is already
+            # identical. Writing to it could also write through to a linked original.
+            return
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            # e.g. EXDEV when the copy lands on another filesystem
+            pass
+    shutil.copy2(src, dst)
+
+
+def _copy_repo(source: Path, repo_path: Path) -> None:
+    """Copies a test repository layout into `repo_path` and points its remotes at the copied remote."""
+    shutil.copytree(source, repo_path, copy_function=_link_or_copy, dirs_exist_ok=True)
+    run_git_batch(
+        [["remote", "set-url", remote, str(repo_path / "remote")] for remote in TEST_REMOTES],
+        cwd=repo_path,
+    )
 
 
 @pytest.fixture
-def git_repo() -> Generator[Path, Any, None]:
+def git_repo(
+    _git_repo_template: Path, tmp_path_factory: pytest.TempPathFactory, monkeypatch: pytest.MonkeyPatch
+) -> Generator[Path, Any, None]:
     """
     A pytest fixture that creates a temporary Git repository for testing.
 
     This fixture creates a "remote" non-bare repository and configures
     the local test repo to use it as 'origin'. This allows for testing
     commands that involve fetching or pushing.
+
+    The repository is a copy of the session-wide template, so setting it up
+    costs a directory copy instead of a series of git invocations.
     """
-    with tempfile.TemporaryDirectory() as tmpdir:
-        repo_path = Path(tmpdir)
-        original_dir = Path.cwd()
-        os.chdir(repo_path)
+    repo_path = tmp_path_factory.mktemp("repo")
+    _copy_repo(_git_repo_template, repo_path)
 
-        # Set GIT_EDITOR to prevent interactive prompts
-        original_editor = os.environ.get("GIT_EDITOR")
-        os.environ["GIT_EDITOR"] = "true"
+    # Both are reverted by monkeypatch at teardown
+    monkeypatch.chdir(repo_path)
+    # Set GIT_EDITOR to prevent interactive prompts
+    monkeypatch.setenv("GIT_EDITOR", "true")
 
-        try:
-            # 1. Create a non-bare repository to act as the remote "origin"
-            remote_path = repo_path / "remote"
-            remote_path.mkdir()
-            run_git_command(["init"], cwd=str(remote_path))
-
-            # Configure the remote repository to accept pushes
-            run_git_command(
-                ["config", "receive.denyCurrentBranch", "updateInstead"],
-                cwd=str(remote_path),
-            )
-            run_git_command(["config", "user.name", "Remote User"], cwd=str(remote_path))
-            run_git_command(
-                ["config", "user.email", "remote@example.com"],
-                cwd=str(remote_path),
-            )
-
-            # 2. Initialize the local repository
-            run_git_command(["init", "-b", "main"])
-            run_git_command(["config", "user.name", "Test User"])
-            run_git_command(["config", "user.email", "test@example.com"])
-
-            # 3. Add the non-bare repository as the 'origin' remote
-            run_git_command(["remote", "add", "origin", str(remote_path)])
-            # Add another remote for testing custom remote env vars
-            run_git_command(["remote", "add", "another_remote", str(remote_path)])
-            # Add upstream remote for sync tests
-            run_git_command(["remote", "add", "upstream", str(remote_path)])
-
-            # 4. Create an initial commit in the remote repository
-            initial_file = remote_path / "initial.txt"
-            initial_file.write_text("initial commit")
-            run_git_command(["add", "initial.txt"], cwd=str(remote_path))
-            run_git_command(
-                ["commit", "-m", "Initial commit"],
-                cwd=str(remote_path),
-            )
-
-            # 5. Pull the initial commit to establish the connection
-            run_git_command(["pull", "origin", "main"])
-
-            yield repo_path
-        finally:
-            # Teardown: Change back to the original directory and restore GIT_EDITOR
-            os.chdir(original_dir)
-            if original_editor is None:
-                if "GIT_EDITOR" in os.environ:
-                    del os.environ["GIT_EDITOR"]
-            else:
-                os.environ["GIT_EDITOR"] = original_editor
+    yield repo_path
+    # Stop the hash lookup processes started against this repository
+    close_cat_files()
+
+
+@pytest.fixture
+def mm(git_repo: Path) -> MetadataManager:
+    """
+    A MetadataManager for the test repository, shared by the whole test.
+
+    Its loads are cached against the metadata file's stat signature, so graphs
+    written by sd commands in between are still picked up.
+    """
+    return MetadataManager()
+
+
+@pytest.fixture(scope="session")
+def _stack_snapshots() -> dict[tuple[str | tuple[str, str], ...], Path]:
+    """Repositories built by `make_stack`, keyed by its arguments."""
+    return {}
+
+
+@pytest.fixture
+def make_stack(
+    git_repo: Path,
+    _stack_snapshots: dict[tuple[str | tuple[str, str], ...], Path],
+    tmp_path_factory: pytest.TempPathFactory,
+) -> Callable[..., None]:
+    """
+    A factory that stacks the given branches onto main in the test repository.
+
+    `make_stack("A", "B")` leaves the repository as `sd add A; sd add B` would,
+    with B checked out. A `(parent, name)` pair checks out `parent` before adding
+    `name`, so `make_stack("A", "B", ("A", "C"))` gives A the children B and C.
+    The first test to ask for a given stack builds it with sd and snapshots the
+    repository; later tests copy the snapshot instead.
+    """
+
+    def _make_stack(*names: str | tuple[str, str]) -> None:
+        snapshot = _stack_snapshots.get(names)
+        if snapshot is not None:
+            _copy_repo(snapshot, git_repo)
+            return
+        for name in names:
+            if isinstance(name, tuple):
+                parent, name = name
+                run_git_command(["checkout", "-q", parent])
+            run_sd_command(["add", name])
+        snapshot = tmp_path_factory.mktemp("stack")
+        shutil.copytree(git_repo, snapshot, copy_function=_link_or_copy, dirs_exist_ok=True)
+        _stack_snapshots[names] = snapshot
+
+    return _make_stack
@@ -1,7 +1,10 @@
+import json
 from pathlib import Path
 
 import pytest
 
+from stacked_diffs.utils.classes import Alias, CommandConfig
+from stacked_diffs.utils.metadata import MetadataManager
 from tests.utils import (
     run_sd_command,
 )
@@ -38,18 +41,16 @@ def test_alias_set_list_rm(git_repo: Path, capsys):
     assert e.value.code != 0
 
 
-def test_alias_set_overwrite_existing_user_alias(git_repo: Path, capsys):
+def test_alias_set_overwrite_existing_user_alias(mm: MetadataManager, capsys):
     """Verify setting an alias overwrites an existing user alias with the same name."""
     run_sd_command(["alias", "set", "my-alias", "--run", "echo first version"])
-    capsys.readouterr()
-
     run_sd_command(["alias", "set", "my-alias", "--run", "echo second version"])
     capsys.readouterr()
 
-    run_sd_command(["alias", "list"])
-    captured_list = capsys.readouterr()
-    assert "my-alias: User alias for: echo second version" in captured_list.out
-    assert "my-alias: User alias for: echo first version" not in captured_list.out
+    assert mm.load_user_aliases()["my-alias"] == Alias(
+        description="User alias for: echo second version",
+        command=CommandConfig(run="echo second version"),
+    )
 
     run_sd_command(["my-alias"])
     captured_run = capsys.readouterr()
@@ -57,7 +58,39 @@ def test_alias_set_overwrite_existing_user_alias(git_repo: Path, capsys):
     assert "first version" not in captured_run.out
 
 
-def test_alias_set_missing_run_command(git_repo: Path, capsys):
+def test_alias_set_preserves_other_user_aliases(git_repo: Path, capsys):
+    """Verify setting a second alias keeps the previously saved user alias intact."""
+    run_sd_command(["alias", "set", "first-alias", "--run", "echo first", "--env", "FOO=bar"])
+    run_sd_command(["alias", "set", "second-alias", "--run", "echo second"])
+    capsys.readouterr()
+
+    run_sd_command(["alias", "show", "first-alias"])
+    captured = capsys.readouterr()
+    assert "Run command: echo first" in captured.out
+    assert "FOO=bar" in captured.out
+
+    run_sd_command(["second-alias"])
+    assert "second" in capsys.readouterr().out
+
+
+def test_alias_set_through_symlinked_alias_file(git_repo: Path, mm: MetadataManager):
+    """Verify saving aliases writes through a symlinked .sd_aliases.json and keeps its permissions."""
+    target = git_repo / "shared-aliases.json"
+    target.write_text("{}")
+    target.chmod(0o600)
+    (git_repo / ".sd_aliases.json").symlink_to(target.name)
+
+    run_sd_command(["alias", "set", "linked-alias", "--run", "echo linked"])
+
+    alias_file = git_repo / ".sd_aliases.json"
+    assert alias_file.is_symlink()
+    assert alias_file.resolve() == target
+    assert "linked-alias" in json.loads(target.read_text())
+    assert target.stat().st_mode & 0o777 == 0o600
+    assert "linked-alias" in mm.load_user_aliases()
+
+
+def test_alias_set_missing_run_command(mm: MetadataManager, capsys):
     """Verify `sd alias set` fails if no --run command is provided."""
     with pytest.raises(SystemExit) as e:
         run_sd_command(["alias", "set", "bad-alias"])
@@ -66,9 +99,7 @@ def test_alias_set_missing_run_command(git_repo: Path, capsys):
     assert "the following arguments are required: --run" in captured.err
 
     # Verify the bad alias was not set
-    run_sd_command(["alias", "list"])
-    captured_list = capsys.readouterr()
-    assert "bad-alias" not in captured_list.out
+    assert "bad-alias" not in mm.get_all_aliases()
 
 
 def test_alias_rm_non_existent_alias(git_repo: Path, capsys):
@@ -129,7 +160,7 @@ def test_alias_set_shadow_builtin_command_name_and_run_behavior(git_repo: Path,
     )  # Characteristic output of the real 'tree' command (empty or with stacks)
 
 
-def test_alias_set_with_advanced_features(git_repo: Path, capsys):
+def test_alias_set_with_advanced_features(mm: MetadataManager):
     """Test setting an alias with advanced features like pre-flight, post-flight, env vars, etc."""
     run_sd_command(
         [
@@ -155,9 +186,41 @@ def test_alias_set_with_advanced_features(git_repo: Path, capsys):
             "--descendants-only",
         ]
     )
-    capsys.readouterr()
 
     # Verify the alias was created with all features
+    assert mm.load_user_aliases()["advanced-alias"] == Alias(
+        description="An advanced alias for testing",
+        command=CommandConfig(
+            run="echo main command",
+            pre_flight="echo pre-flight command",
+            post_flight="echo post-flight command",
+            descendants_only=True,
+        ),
+        continue_cmd="echo continuing",
+        abort_cmd="echo aborting",
+        env={"TEST_VAR": "test_value", "ANOTHER_VAR": "another_value"},
+    )
+
+
+def test_alias_show_user_alias(mm: MetadataManager, capsys):
+    """Test showing all details of a user-defined alias."""
+    mm.save_user_aliases(
+        {
+            "advanced-alias": Alias(
+                description="An advanced alias for testing",
+                command=CommandConfig(
+                    run="echo main command",
+                    pre_flight="echo pre-flight command",
+                    post_flight="echo post-flight command",
+                    descendants_only=True,
+                ),
+                continue_cmd="echo continuing",
+                abort_cmd="echo aborting",
+                env={"TEST_VAR": "test_value", "ANOTHER_VAR": "another_value"},
+            )
+        }
+    )
+
     run_sd_command(["alias", "show", "advanced-alias"])
     captured = capsys.readouterr()
     assert "Alias: advanced-alias (user-defined)" in captured.out
@@ -5,6 +5,7 @@ Tests combinations of commands and edge cases that might occur in practice.
 
 import os
 import subprocess
+from collections.abc import Callable
 from pathlib import Path
 from unittest.mock import patch
 
@@ -12,22 +13,18 @@ import pytest
 
 from stacked_diffs.utils import git
 from stacked_diffs.utils.metadata import MetadataManager
-from tests.utils import get_commit_hash, run_git_command, run_sd_command
+from tests.utils import commit_file, get_commit_hash, run_git_command, run_sd_command
 
 
 def test_sync_with_merge_conflicts_and_stash_conflicts(git_repo: Path):
     """Test sync operation with both merge conflicts and stash conflicts."""
     # Create a stack with changes
     run_sd_command(["add", "feature"])
-    (git_repo / "feature.txt").write_text("feature content")
-    run_git_command(["add", "."])
-    run_git_command(["commit", "-m", "Feature commit"])
+    commit_file(git_repo, "feature.txt", "feature content", "Feature commit")
 
     # Make conflicting changes on main
     run_git_command(["checkout", "main"])
-    (git_repo / "feature.txt").write_text("main content")
-    run_git_command(["add", "."])
-    run_git_command(["commit", "-m", "Main commit"])
+    commit_file(git_repo, "feature.txt", "main content", "Main commit")
     run_git_command(["push", "origin", "main"])
 
     # Go back to feature and make uncommitted changes
@@ -47,27 +44,37 @@ def test_prune_during_active_rebase(git_repo: Path):
     """Test prune command when git is in middle of rebase operation."""
     # Create branches
     run_sd_command(["add", "feature"])
-    (git_repo / "file.txt").write_text("feature content")
-    run_git_command(["add", "."])
-    run_git_command(["commit", "-m", "Feature commit"])
-
-    run_git_command(["checkout", "main"])
-    (git_repo / "file.txt").write_text("main content")
-    run_git_command(["add", "."])
-    run_git_command(["commit", "-m", "Main commit"])
 
-    # Start rebase that will conflict
-    run_git_command(["checkout", "feature"])
-    try:
-        run_git_command(["rebase", "main"], check=False)
-    except subprocess.CalledProcessError:
-        pass  # Expected to fail due to conflict
+    # Put git into a rebase of feature onto main without running one: the
+    # rebase-merge directory is the state git and sd both detect
+    rebase_dir = git_repo / ".git" / "rebase-merge"
+    rebase_dir.mkdir()
+    (rebase_dir / "head-name").write_text("refs/heads/feature\n")
+    (rebase_dir / "onto").write_text(get_commit_hash("main") + "\n")
+    assert "You are currently rebasing" in run_git_command(["status"], capture_output=True).stdout
 
     # Prune should handle active rebase state
     with pytest.raises(SystemExit):
         run_sd_command(["prune"])
 
 
+def test_tree_and_alias_list_during_active_rebase(git_repo: Path, capsys):
+    """Test that read-only commands still work while git is in the middle of a rebase."""
+    run_sd_command(["add", "feature"])
+    (git_repo / ".git" / "rebase-merge").mkdir()
+    capsys.readouterr()
+
+    run_sd_command(["tree"])
+    assert "feature" in capsys.readouterr().out
+
+    run_sd_command(["alias", "list"])
+    assert "--- Built-in Aliases ---" in capsys.readouterr().out
+
+    # Commands that move branches are still refused
+    with pytest.raises(SystemExit):
+        run_sd_command(["add", "blocked"])
+
+
 def test_add_branch_with_dirty_working_directory(git_repo: Path):
     """Test adding branch when working directory has uncommitted changes."""
     # Make uncommitted changes
@@ -160,11 +167,10 @@ def test_multiple_stacks_independent_operations(git_repo: Path):
     assert not (git_repo / "stack1-stack2-child.txt").exists()
 
 
-def test_branch_deletion_during_run_operation(git_repo: Path):
+def test_branch_deletion_during_run_operation(make_stack: Callable[..., None]):
     """Test behavior when branches are deleted externally during run operation."""
     # Create stack
-    run_sd_command(["add", "base"])
-    run_sd_command(["add", "child"])
+    make_stack("base", "child")
 
     # Create alias that will be interrupted
     run_sd_command(
@@ -173,7 +179,7 @@ def test_branch_deletion_during_run_operation(git_repo: Path):
             "set",
             "interruptible",
             "--run",
-            "echo processing $SD_CURRENT_BRANCH && sleep 1 && false",  # Will fail
+            "echo processing $SD_CURRENT_BRANCH && false",  # Will fail
         ]
     )
 
@@ -250,6 +256,8 @@ def test_concurrent_sd_processes_simulation(git_repo: Path):
     assert "process2-branch" in final_graph.branches
 
 
+@pytest.mark.slow
+@pytest.mark.skipif(os.geteuid() == 0, reason="root bypasses directory permissions")
 def test_filesystem_permission_issues_simulation(git_repo: Path):
     """Test behavior when filesystem permissions prevent operations."""
     mm = MetadataManager()
@@ -297,8 +305,9 @@ def test_network_timeout_during_sync(git_repo: Path):
     # Remove upstream remote (which sync uses by default) to simulate network issues
     run_git_command(["remote", "remove", "upstream"])
 
-    # Add fake upstream remote that will timeout
-    run_git_command(["remote", "add", "upstream", "https://nonexistent.example.com/repo.git"])
+    # Add fake upstream remote that is unreachable. Port 1 on the loopback refuses the
+    # connection at once, without waiting on DNS or a connect timeout.
+    run_git_command(["remote", "add", "upstream", "http://127.0.0.1:1/repo.git"])
 
     # Sync should fail due to network issues
     with pytest.raises(SystemExit):
@@ -314,6 +323,8 @@ def test_git_hooks_interference(git_repo: Path):
     pre_commit_hook = hooks_dir / "pre-commit"
     pre_commit_hook.write_text("#!/bin/sh\nexit 1\n")
     pre_commit_hook.chmod(0o755)
+    # The test git config disables hooks; re-enable the repository's own
+    run_git_command(["config", "--local", "core.hooksPath", ".git/hooks"])
 
     # Operations that trigger commits should handle hook failures
     run_sd_command(["add", "hook-test"])
@@ -5,11 +5,13 @@ Tests complex scenarios and error conditions not covered in main test files.
 
 import os
 import subprocess
+from collections.abc import Callable
 from pathlib import Path
 from unittest.mock import patch
 
 import pytest
 
+from stacked_diffs.utils import git
 from stacked_diffs.utils.metadata import MetadataManager
 from tests.utils import (
     get_commit_hash,
@@ -80,15 +82,35 @@ def test_detached_head_state(git_repo: Path):
     assert "detached-branch" in graph.branches
 
 
-def test_empty_repository_handling(git_repo: Path):
+def test_current_branch_matches_git(git_repo: Path, monkeypatch: pytest.MonkeyPatch):
+    """Test that the current branch read from the HEAD file matches `git rev-parse --abbrev-ref HEAD`."""
+
+    def assert_matches_git() -> None:
+        git.clear_current_branch_cache()
+        expected = run_git_command(["rev-parse", "--abbrev-ref", "HEAD"], capture_output=True).stdout.strip()
+        assert git.get_current_branch() == expected
+
+    assert_matches_git()
+
+    # Detached HEAD
+    run_git_command(["checkout", get_commit_hash("HEAD")])
+    assert_matches_git()
+
+    # Linked worktree, whose HEAD lives in its own git dir
+    worktree_path = git_repo / "linked-worktree"
+    run_git_command(["worktree", "add", "-b", "worktree-branch", str(worktree_path)])
+    monkeypatch.chdir(worktree_path)
+    assert_matches_git()
+
+
+def test_empty_repository_handling(git_repo: Path, monkeypatch: pytest.MonkeyPatch):
     """Test behavior with empty repository (no commits)."""
     # Create a new empty repo
     empty_repo = git_repo / "empty"
     empty_repo.mkdir()
-    os.chdir(empty_repo)
+    monkeypatch.chdir(empty_repo)
+    # No commits are made, so the repository needs no user identity
     run_git_command(["init"])
-    run_git_command(["config", "user.name", "Test User"])
-    run_git_command(["config", "user.email", "test@example.com"])
 
     # Test operations on empty repo - should work and show empty tree
     run_sd_command(["tree"])
@@ -99,6 +121,21 @@ def test_empty_repository_handling(git_repo: Path):
     assert len(graph.branches) == 0
 
 
+def test_git_state_check_in_linked_worktree(git_repo: Path, monkeypatch: pytest.MonkeyPatch):
+    """Test that an in-progress rebase is detected from inside a linked worktree."""
+    worktree_path = git_repo / "linked-worktree"
+    run_git_command(["worktree", "add", "-b", "worktree-branch", str(worktree_path)])
+    monkeypatch.chdir(worktree_path)
+
+    # In a linked worktree '.git' is a file; the rebase state lives in the worktree's git dir
+    git_dir = Path(run_git_command(["rev-parse", "--absolute-git-dir"], capture_output=True).stdout.strip())
+    (git_dir / "rebase-merge").mkdir()
+
+    with pytest.raises(SystemExit) as exc_info:
+        run_sd_command(["add", "blocked-branch"])
+    assert exc_info.value.code == 1
+
+
 def test_concurrent_metadata_access(git_repo: Path):
     """Test concurrent access to metadata files."""
     mm1 = MetadataManager()
@@ -161,6 +198,30 @@ def test_circular_dependency_prevention(git_repo: Path):
     run_sd_command(["tree"])
 
 
+def test_cycle_is_reported_and_run_from_root_terminates(git_repo: Path, capsys):
+    """Test that a metadata cycle is reported and a start-from-root run still finishes."""
+    mm = MetadataManager()
+    graph = mm.load_graph()
+
+    from stacked_diffs.utils.classes import BranchMeta
+
+    graph.branches["A"] = BranchMeta(children=["B"])
+    graph.branches["B"] = BranchMeta(children=["A"])  # Circular!
+    mm.save_graph(graph)
+
+    run_git_command(["checkout", "-b", "A"])
+    run_git_command(["checkout", "-b", "B"])
+    run_sd_command(["alias", "set", "root-echo", "--run", "echo on-$SD_CURRENT_BRANCH", "--start-from-root"])
+    capsys.readouterr()
+
+    # Finding the stack root must not follow the cycle forever
+    run_sd_command(["root-echo"])
+    captured = capsys.readouterr()
+    assert "Branch metadata contains a cycle: A -> B -> A" in captured.err
+    assert "[A]> echo on-$SD_CURRENT_BRANCH" in captured.out
+    assert "[B]> echo on-$SD_CURRENT_BRANCH" in captured.out
+
+
 def test_branch_with_special_characters(git_repo: Path):
     """Test creating branches with special characters."""
     # Test various special characters that might cause issues
@@ -182,14 +243,10 @@ def test_branch_with_special_characters(git_repo: Path):
             pass
 
 
-def test_very_deep_stack_performance(git_repo: Path):
+def test_very_deep_stack_performance(make_stack: Callable[..., None]):
     """Test performance with very deep stacks."""
     # Create a deep stack (20 levels)
-    current_branch = "main"
-    for i in range(20):
-        branch_name = f"level-{i}"
-        run_sd_command(["add", branch_name])
-        current_branch = branch_name
+    make_stack(*(f"level-{i}" for i in range(20)))
 
     # Test that tree display works
     run_sd_command(["tree"])
@@ -198,10 +255,9 @@ def test_very_deep_stack_performance(git_repo: Path):
     run_sd_command(["run", "echo $SD_CURRENT_BRANCH"])
 
 
-def test_interrupted_operation_recovery(git_repo: Path):
+def test_interrupted_operation_recovery(make_stack: Callable[..., None]):
     """Test recovery from interrupted operations."""
-    run_sd_command(["add", "base"])
-    run_sd_command(["add", "child"])
+    make_stack("base", "child")
 
     # Create a test alias first
     run_sd_command(["alias", "set", "test", "--run", "echo test"])
@@ -274,3 +330,16 @@ def test_prune_with_complex_merge_scenarios(git_repo: Path):
     # feature-a-sub should now have no parent in the graph (orphaned)
     # but it should still be tracked
     assert graph.branches["feature-a-sub"].children == []
+
+
+def test_metadata_manager_shared_per_command(git_repo: Path):
+    """Test that one MetadataManager is shared within a command and replaced by the next command."""
+    from stacked_diffs.utils.metadata import get_metadata_manager
+
+    first = get_metadata_manager()
+    assert get_metadata_manager() is first
+
+    run_sd_command(["add", "shared-mm"])
+    # Each sd invocation starts with a fresh manager, so it sees the files as they are now
+    assert get_metadata_manager() is not first
+    assert "shared-mm" in get_metadata_manager().load_graph().branches
@@ -4,6 +4,7 @@ Tests complex argument parsing scenarios and dynamic alias dispatch.
 """
 
 import sys
+from collections.abc import Callable
 from pathlib import Path
 from unittest.mock import patch
 
@@ -109,6 +110,17 @@ def test_run_command_validation(git_repo: Path):
         run_sd_command(["run"])
 
 
+def test_run_validation_error_shows_full_usage(git_repo: Path, capsys):
+    """Test that `sd run` validation errors print the usage line listing every sub-command."""
+    with pytest.raises(SystemExit) as exc_info:
+        run_sd_command(["run"])
+
+    assert exc_info.value.code == 2
+    captured = capsys.readouterr()
+    assert "usage: sd [-h] {add,run,tree,prune,alias} ..." in captured.err
+    assert "A COMMAND is required for a new run operation." in captured.err
+
+
 def test_alias_dispatch_with_complex_arguments(git_repo: Path):
     """Test alias dispatch with complex argument combinations."""
     run_sd_command(["add", "test-branch"])
@@ -134,28 +146,21 @@ def test_alias_dispatch_with_complex_arguments(git_repo: Path):
     run_sd_command(["complex-alias", "TEST_VAR=override"])
 
 
-def test_non_git_repository_handling(git_repo: Path, capsys):
+def test_non_git_repository_handling(git_repo: Path, capsys, monkeypatch: pytest.MonkeyPatch):
     """Test behavior when not in a git repository."""
     # Create non-git directory
     non_git_dir = git_repo.parent / "non-git"
     non_git_dir.mkdir(exist_ok=True)
 
     # Change to non-git directory
-    import os
+    monkeypatch.chdir(non_git_dir)
 
-    original_cwd = os.getcwd()
-    try:
-        os.chdir(non_git_dir)
-
-        with pytest.raises(SystemExit) as exc_info:
-            run_sd_command(["tree"])
-
-        assert exc_info.value.code == 1
-        captured = capsys.readouterr()
-        assert "Please run sd from a git repository" in captured.out
+    with pytest.raises(SystemExit) as exc_info:
+        run_sd_command(["tree"])
 
-    finally:
-        os.chdir(original_cwd)
+    assert exc_info.value.code == 1
+    captured = capsys.readouterr()
+    assert "Please run sd from a git repository" in captured.out
 
 
 def test_alias_environment_inheritance(git_repo: Path):
@@ -202,12 +207,10 @@ def test_alias_with_descendants_only_flag(git_repo: Path):
     assert (git_repo / "file-child2.txt").exists()
 
 
-def test_alias_with_start_from_root_flag(git_repo: Path):
+def test_alias_with_start_from_root_flag(git_repo: Path, make_stack: Callable[..., None]):
     """Test alias with start_from_root configuration."""
     # Create deep stack
-    run_sd_command(["add", "root"])
-    run_sd_command(["add", "middle"])
-    run_sd_command(["add", "leaf"])
+    make_stack("root", "middle", "leaf")
 
     # Create alias that starts from root
     run_sd_command(
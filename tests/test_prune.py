@@ -1,31 +1,31 @@
 from pathlib import Path
 
+from stacked_diffs.utils import git
 from stacked_diffs.utils.metadata import MetadataManager
 from tests.utils import (
+    commit_file,
     get_commit_hash,
     run_git_command,
     run_sd_command,
 )
 
 
-def test_prune_removes_dangling_metadata(git_repo: Path):
+def test_prune_removes_dangling_metadata(mm: MetadataManager):
     """Verify `sd prune` removes branches from metadata if deleted locally."""
     run_sd_command(["add", "feature-dangling"])
-    mm_before = MetadataManager()
-    graph_before = mm_before.load_graph()
+    graph_before = mm.load_graph()
     assert "feature-dangling" in graph_before.branches
 
     run_git_command(["checkout", "main"])  # Ensure not on the branch to be deleted
     run_git_command(["branch", "-D", "feature-dangling"])
-    assert "feature-dangling" not in run_git_command(["branch"]).stdout
+    assert "feature-dangling" not in git.get_local_branches()
 
     run_sd_command(["prune"])
-    mm_after = MetadataManager()
-    graph_after = mm_after.load_graph()
+    graph_after = mm.load_graph()
     assert "feature-dangling" not in graph_after.branches
 
 
-def test_prune_keeps_existing_branches(git_repo: Path):
+def test_prune_keeps_existing_branches(mm: MetadataManager):
     """Verify `sd prune` keeps branches that still exist locally, even if merged."""
     run_sd_command(["add", "completed-feature"])
     run_git_command(["checkout", "main"])
@@ -33,38 +33,31 @@ def test_prune_keeps_existing_branches(git_repo: Path):
     run_git_command(["push", "origin", "main"])
 
     run_sd_command(["prune"])
-    mm = MetadataManager()
     graph_after = mm.load_graph()
     # Branch still exists locally, so it should remain in metadata
     assert "completed-feature" in graph_after.branches
-    local_branches_raw = run_git_command(["branch"]).stdout
-    assert "completed-feature" in local_branches_raw
+    assert "completed-feature" in git.get_local_branches()
 
 
-def test_prune_no_branches_to_prune(git_repo: Path):
+def test_prune_no_branches_to_prune(git_repo: Path, mm: MetadataManager):
     """Verify `sd prune` does nothing when all tracked branches exist locally."""
     run_sd_command(["add", "feature-unmerged"])
     run_git_command(["checkout", "feature-unmerged"])
-    (git_repo / "unmerged_file.txt").write_text("unmerged content")
-    run_git_command(["add", "."])
-    run_git_command(["commit", "-m", "Commit on feature-unmerged"])
+    commit_file(git_repo, "unmerged_file.txt", "unmerged content", "Commit on feature-unmerged")
 
     initial_branch_commit_hash = get_commit_hash("HEAD")
-    mm_before = MetadataManager()
-    graph_before = mm_before.load_graph()
+    graph_before = mm.load_graph()
 
     run_sd_command(["prune"])
 
-    mm_after = MetadataManager()
-    graph_after = mm_after.load_graph()
+    graph_after = mm.load_graph()
 
     assert graph_before == graph_after, "Metadata graph should not have changed."
-    local_branches_raw = run_git_command(["branch"]).stdout
-    assert "feature-unmerged" in local_branches_raw
+    assert "feature-unmerged" in git.get_local_branches()
     assert get_commit_hash("HEAD") == initial_branch_commit_hash, "Should be back on the initial branch."
 
 
-def test_prune_updates_parent_child_relationships(git_repo: Path):
+def test_prune_updates_parent_child_relationships(mm: MetadataManager):
     """Verify `sd prune` cleans up parent-child relationships when removing dangling metadata."""
     # Setup a stack: main -> p1 -> c1
     run_sd_command(["add", "p1"])
@@ -72,8 +65,7 @@ def test_prune_updates_parent_child_relationships(git_repo: Path):
     run_sd_command(["add", "c1"])
 
     # Verify the relationship exists
-    mm_before = MetadataManager()
-    graph_before = mm_before.load_graph()
+    graph_before = mm.load_graph()
     assert "c1" in graph_before.branches["p1"].children
 
     # Delete c1 locally but keep p1
@@ -82,11 +74,21 @@ def test_prune_updates_parent_child_relationships(git_repo: Path):
 
     run_sd_command(["prune"])
 
-    mm_after = MetadataManager()
-    graph_after = mm_after.load_graph()
+    graph_after = mm.load_graph()
 
     # c1 should be removed from metadata
     assert "c1" not in graph_after.branches
     # p1 should still exist but with no children
     assert "p1" in graph_after.branches
     assert "c1" not in graph_after.branches["p1"].children
+
+
+def test_prune_keeps_branch_checked_out_in_other_worktree(git_repo: Path, mm: MetadataManager):
+    """Verify `sd prune` keeps a branch that is checked out in a linked worktree."""
+    run_sd_command(["add", "worktree-feature"])
+    run_git_command(["checkout", "main"])
+    run_git_command(["worktree", "add", str(git_repo / "linked-worktree"), "worktree-feature"])
+
+    run_sd_command(["prune"])
+    graph_after = mm.load_graph()
+    assert "worktree-feature" in graph_after.branches
@@ -1,9 +1,13 @@
+import os
+from collections.abc import Callable
 from pathlib import Path
 
 import pytest
 
 from stacked_diffs.utils.metadata import MetadataManager
+from stacked_diffs.utils.util import _split_simple_command
 from tests.utils import (
+    commit_file,
     get_commit_hash,
     get_parent_hash,
     run_git_command,
@@ -14,13 +18,9 @@ from tests.utils import (
 def test_update_alias(git_repo: Path):
     """Verify the built-in `sd update` alias correctly rebases descendant branches."""
     run_sd_command(["add", "base"])
-    (git_repo / "base.txt").write_text("base")
-    run_git_command(["add", "."])
-    run_git_command(["commit", "-m", "Commit on base"])
+    commit_file(git_repo, "base.txt", "base", "Commit on base")
     run_sd_command(["add", "child"])
-    (git_repo / "child.txt").write_text("child")
-    run_git_command(["add", "."])
-    run_git_command(["commit", "-m", "Commit on child"])
+    commit_file(git_repo, "child.txt", "child", "Commit on child")
     original_child_parent_hash = get_parent_hash("child")
 
     run_git_command(["checkout", "base"])
@@ -37,20 +37,14 @@ def test_update_alias(git_repo: Path):
 def test_sync_alias_with_stash(git_repo: Path):
     """Verify the built-in `sd sync` alias rebases the whole stack and handles stashing."""
     run_sd_command(["add", "base"])
-    (git_repo / "base.txt").write_text("base")
-    run_git_command(["add", "."])
-    run_git_command(["commit", "-m", "Commit for base"])
+    commit_file(git_repo, "base.txt", "base", "Commit for base")
     original_base_parent_hash = get_parent_hash("base")
 
     run_sd_command(["add", "child"])
-    (git_repo / "child.txt").write_text("child")
-    run_git_command(["add", "."])
-    run_git_command(["commit", "-m", "Commit on child"])
+    commit_file(git_repo, "child.txt", "child", "Commit on child")
 
     run_git_command(["checkout", "main"])
-    (git_repo / "upstream.txt").write_text("upstream change")
-    run_git_command(["add", "."])
-    run_git_command(["commit", "-m", "New work on main"])
+    commit_file(git_repo, "upstream.txt", "upstream change", "New work on main")
     run_git_command(["push", "--force", "origin", "main"])
     new_main_hash = get_commit_hash("main")
 
@@ -66,10 +60,9 @@ def test_sync_alias_with_stash(git_repo: Path):
     assert new_base_parent_hash == new_main_hash
 
 
-def test_run_simple_command(git_repo: Path):
+def test_run_simple_command(git_repo: Path, make_stack: Callable[..., None]):
     """Verify `sd run` executes a command on the current branch and its descendants."""
-    run_sd_command(["add", "base"])
-    run_sd_command(["add", "service"])
+    make_stack("base", "service")
     run_git_command(["checkout", "base"])
     run_sd_command(["run", "touch test-file-$SD_CURRENT_BRANCH"])
 
@@ -78,16 +71,93 @@ def test_run_simple_command(git_repo: Path):
     assert (git_repo / "test-file-service").exists()
 
 
+def test_run_expands_variables_like_the_shell(git_repo: Path, make_stack: Callable[..., None]):
+    """Verify commands sd runs without a shell still see variables expanded as /bin/sh would."""
+    make_stack("base", "service")
+    run_git_command(["checkout", "base"])
+    # Run directly: every referenced variable is set to a plain word
+    run_sd_command(["run", "touch braced-${SD_CURRENT_BRANCH}-on-$SD_PARENT_BRANCH"])
+    # Needs the shell: an unset variable expands to nothing
+    run_sd_command(["run", "touch unset-$SD_TEST_UNSET_VAR$SD_CURRENT_BRANCH"])
+
+    assert (git_repo / "braced-base-on-main").exists()
+    assert (git_repo / "braced-service-on-base").exists()
+    assert (git_repo / "unset-base").exists()
+    assert (git_repo / "unset-service").exists()
+
+
+def test_run_script_without_shebang(git_repo: Path, make_stack: Callable[..., None]):
+    """Verify `sd run` runs an executable script without a shebang through the shell, as /bin/sh would."""
+    make_stack("base", "service")
+    run_git_command(["checkout", "base"])
+    script = git_repo / "build.sh"
+    script.write_text('echo "$SD_PARENT_BRANCH" > built-$SD_CURRENT_BRANCH.txt\n')
+    script.chmod(0o755)
+
+    run_sd_command(["run", "./build.sh"])
+
+    assert (git_repo / "built-base.txt").read_text() == "main\n"
+    assert (git_repo / "built-service.txt").read_text() == "base\n"
+
+
+def test_run_shell_builtins_use_the_shell():
+    """Verify commands naming a shell builtin aren't run as the same-named program on PATH."""
+    env = {"PATH": os.defpath}
+    assert _split_simple_command("echo -e x", env) is None
+    assert _split_simple_command("test -f x", env) is None
+    assert _split_simple_command("touch x", env) is not None
+
+
+def test_simple_command_split_matches_shell():
+    """Verify commands run without a shell get the argv /bin/sh would pass."""
+    env = {"PATH": os.defpath, "BRANCH": "base"}
+    executable, argv = _split_simple_command("  touch \tfile-$BRANCH ", env)
+    # argv[0] stays as typed; only the executable is resolved
+    assert argv == ["touch", "file-base"]
+    assert Path(executable).name == "touch"
+    # The shell only splits on spaces and tabs, so other whitespace stays part of a word
+    assert _split_simple_command("touch\xa0file", env) is None
+    assert _split_simple_command("touch file\x0c", env)[1] == ["touch", "file\x0c"]
+
+
+def test_run_failed_checkout_exits(git_repo: Path, make_stack: Callable[..., None], capsys: pytest.CaptureFixture[str]):
+    """Verify `sd run` stops with a checkout error when a plan branch can't be checked out."""
+    make_stack("base", "child")
+    commit_file(git_repo, "file.txt", "child content", "Commit file.txt on child")
+    run_git_command(["checkout", "base"])
+    # An untracked file that checking out child would overwrite
+    (git_repo / "file.txt").write_text("untracked")
+
+    with pytest.raises(SystemExit) as e:
+        run_sd_command(["run", "true && true"])
+    assert e.value.code == 1
+
+    err = capsys.readouterr().err
+    assert "checkout -q child" in err
+    assert "Command failed" not in err
+
+
+def test_run_user_command_exit_97_is_resumable(make_stack: Callable[..., None], capsys: pytest.CaptureFixture[str]):
+    """Verify a user command exiting with the checkout guard's status is still reported as its own failure."""
+    make_stack("base", "child")
+    run_git_command(["checkout", "base"])
+
+    with pytest.raises(SystemExit) as e:
+        run_sd_command(["run", "exit 97"])
+    assert e.value.code == 1
+
+    assert "Command failed on branch 'base'." in capsys.readouterr().err
+    resume_state = MetadataManager().get_resume_state()
+    assert resume_state is not None
+    assert [action.branch for action in resume_state.plan] == ["child"]
+
+
 def test_update_with_conflict_and_continue(git_repo: Path):
     """Verify the --continue flag works for an alias after a rebase conflict."""
     run_sd_command(["add", "base"])
-    (git_repo / "file.txt").write_text("original base content")
-    run_git_command(["add", "."])
-    run_git_command(["commit", "-m", "Commit on base with file.txt"])
+    commit_file(git_repo, "file.txt", "original base content", "Commit on base with file.txt")
     run_sd_command(["add", "child"])
-    (git_repo / "file.txt").write_text("child makes a change")
-    run_git_command(["add", "."])
-    run_git_command(["commit", "-m", "Child modifies file.txt"])
+    commit_file(git_repo, "file.txt", "child makes a change", "Child modifies file.txt")
 
     run_git_command(["checkout", "base"])
     (git_repo / "file.txt").write_text("base amended content")
@@ -116,15 +186,11 @@ def test_update_with_conflict_and_continue(git_repo: Path):
 def test_update_with_conflict_and_abort(git_repo: Path):
     """Verify the --abort flag works for an alias after a rebase conflict."""
     run_sd_command(["add", "base-abort"])
-    (git_repo / "file.txt").write_text("original base content for abort")
-    run_git_command(["add", "."])
-    run_git_command(["commit", "-m", "Commit on base-abort"])
+    commit_file(git_repo, "file.txt", "original base content for abort", "Commit on base-abort")
     base_abort_commit_hash = get_commit_hash("base-abort")
 
     run_sd_command(["add", "child-abort"])
-    (git_repo / "file.txt").write_text("child-abort makes a change")
-    run_git_command(["add", "."])
-    run_git_command(["commit", "-m", "Child-abort modifies file.txt"])
+    commit_file(git_repo, "file.txt", "child-abort makes a change", "Child-abort modifies file.txt")
     child_abort_original_commit_hash = get_commit_hash("child-abort")
 
     run_git_command(["checkout", "base-abort"])
@@ -201,20 +267,14 @@ def test_sync_alias_with_custom_remote_env(git_repo: Path):
     """Verify `sd sync` alias correctly uses a custom REMOTE environment variable."""
     # Setup a stack
     run_sd_command(["add", "sync-env-base"])
-    (git_repo / "sync-env-base.txt").write_text("base content")
-    run_git_command(["add", "."])
-    run_git_command(["commit", "-m", "Commit on sync-env-base"])
+    commit_file(git_repo, "sync-env-base.txt", "base content", "Commit on sync-env-base")
 
     run_sd_command(["add", "sync-env-child"])
-    (git_repo / "sync-env-child.txt").write_text("child content")
-    run_git_command(["add", "."])
-    run_git_command(["commit", "-m", "Commit on sync-env-child"])
+    commit_file(git_repo, "sync-env-child.txt", "child content", "Commit on sync-env-child")
 
     # Make a change on main in the remote repo (which is also 'another_remote')
     run_git_command(["checkout", "main"])
-    (git_repo / "remote_change.txt").write_text("change from remote")
-    run_git_command(["add", "."])
-    run_git_command(["commit", "-m", "Remote change on main"])
+    commit_file(git_repo, "remote_change.txt", "change from remote", "Remote change on main")
     run_git_command(["push", "--force", "another_remote", "main"])
 
     # Checkout child and run sync using the custom remote
@@ -1,36 +1,43 @@
+from collections.abc import Callable
 from pathlib import Path
 
-from tests.utils import (
-    run_git_command,
-    run_sd_command,
-)
+from stacked_diffs.utils.classes import BranchMeta
+from stacked_diffs.utils.metadata import MetadataManager
+from tests.utils import run_sd_capture
 
+# `sd tree` output for main -> base, with base -> service and base -> ui
+EXPECTED_STACK_TREE = "'main' (Trunk)\n└── base\n    ├── service\n    └── ui\n"
+EXPECTED_NO_STACKS = "No stacks found to display. Your trunk branch is 'main'.\n"
 
-def test_tree_command(git_repo: Path, capsys):
+
+def test_tree_command(make_stack: Callable[..., None]):
     """Verify that `sd tree` prints the correct hierarchical structure."""
-    run_sd_command(["add", "base"])
-    run_sd_command(["add", "service"])  # Stays on service
-    run_git_command(["checkout", "base"])
-    run_sd_command(["add", "ui"])
+    make_stack("base", "service", ("base", "ui"))
+    assert run_sd_capture(["tree"]) == EXPECTED_STACK_TREE
 
-    capsys.readouterr()
-    run_sd_command(["tree"])
 
-    captured = capsys.readouterr()
-    stdout = captured.out
+def test_tree_no_stacks(git_repo: Path):
+    """Verify `sd tree` output when no branches are stacked."""
+    assert run_sd_capture(["tree"]) == EXPECTED_NO_STACKS
 
-    expected_output = "'main' (Trunk)\n└── base\n    ├── service\n    └── ui\n"
-    normalized_stdout = "\n".join(line.strip() for line in stdout.strip().splitlines())
-    normalized_expected = "\n".join(
-        line.strip() for line in expected_output.strip().splitlines()
-    )
-    assert normalized_stdout == normalized_expected
 
+def test_tree_child_without_metadata_entry(git_repo: Path):
+    """Verify `sd tree` renders a child that is listed by its parent but has no metadata entry."""
+    mm = MetadataManager()
+    graph = mm.load_graph()
+    graph.branches["base"] = BranchMeta(children=["orphan-child"])
+    mm.save_graph(graph)
 
-def test_tree_no_stacks(git_repo: Path, capsys):
-    """Verify `sd tree` output when no branches are stacked."""
-    capsys.readouterr()  # Clear buffer
-    run_sd_command(["tree"])
-    captured = capsys.readouterr()
-    expected_output = "No stacks found to display. Your trunk branch is 'main'.\n"
-    assert captured.out == expected_output
+    assert run_sd_capture(["tree"]) == "'main' (Trunk)\n└── base\n    └── orphan-child\n"
+
+
+def test_tree_cycle_below_root(git_repo: Path):
+    """Verify `sd tree` terminates on a cycle in the metadata and marks where it closes."""
+    mm = MetadataManager()
+    graph = mm.load_graph()
+    graph.branches["base"] = BranchMeta(children=["a"])
+    graph.branches["a"] = BranchMeta(children=["b"])
+    graph.branches["b"] = BranchMeta(children=["a"])  # Circular!
+    mm.save_graph(graph)
+
+    assert run_sd_capture(["tree"]) == "'main' (Trunk)\n└── base\n    └── a\n        └── b\n            └── a (cycle)\n"
@@ -1,5 +1,8 @@
+import contextlib
+import io
+import os
+import shlex
 import subprocess
-import sys
 from pathlib import Path
 
 from stacked_diffs import main as sd_main
@@ -8,19 +11,27 @@ from stacked_diffs.utils import git
 
 def run_sd_command(args: list[str]):
     """Helper to run the 'sd' tool with a given list of arguments."""
-    sys.argv = ["sd", *args]
     try:
-        sd_main.main()
+        sd_main.main(args)
+    # Errors exit non-zero; argparse also exits with 0 after printing help
     except SystemExit as e:
         if e.code != 0:
             raise
 
 
+def run_sd_capture(args: list[str]) -> str:
+    """Helper to run the 'sd' tool like `run_sd_command` and return what it printed to stdout."""
+    buffer = io.StringIO()
+    with contextlib.redirect_stdout(buffer):
+        run_sd_command(args)
+    return buffer.getvalue()
+
+
 def run_git_command(
     args: list[str],
     cwd: Path | None = None,
     check: bool = True,
-    capture_output: bool = True,
+    capture_output: bool = False,
 ) -> subprocess.CompletedProcess:
     """
     Helper to run a Git command using subprocess.
@@ -29,7 +40,7 @@ def run_git_command(
     - args: A list of strings representing the command and its arguments (e.g., ["commit", "-m", "Initial commit"]).
     - cwd: The working directory to run the command in. Defaults to None (current directory).
     - check: If True, raises CalledProcessError if the command returns a non-zero exit code. Defaults to True.
-    - capture_output: If True, captures stdout and stderr. Defaults to True.
+    - capture_output: If True, captures stdout and stderr. Defaults to False; pass True when the output is read.
 
     Returns:
     - A subprocess.CompletedProcess instance.
@@ -37,18 +48,129 @@ def run_git_command(
     command = ["git", *args]
     return subprocess.run(
         command,
-        cwd=str(cwd) if cwd else None,
+        cwd=cwd,
         check=check,
         capture_output=capture_output,
         text=True,
     )
 
 
+def run_git_batch(commands: list[list[str]], cwd: Path | None = None) -> subprocess.CompletedProcess:
+    """
+    Helper to run several Git commands in a single shell invocation.
+
+    The commands are chained with `&&`, so the batch stops at the first failing
+    command and raises CalledProcessError.
+
+    Parameters:
+    - commands: A list of Git argument lists (e.g., [["add", "."], ["commit", "-m", "msg"]]).
+    - cwd: The working directory to run the commands in. Defaults to None (current directory).
+
+    Returns:
+    - A subprocess.CompletedProcess instance.
+    """
+    script = " && ".join(shlex.join(["git", *args]) for args in commands)
+    return subprocess.run(
+        script,
+        shell=True,
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+
+
+def commit_file(repo_path: Path, name: str, content: str, message: str) -> None:
+    """Helper to write a file in the repository and commit it, staging and committing in one shell invocation."""
+    (repo_path / name).write_text(content)
+    run_git_batch([["add", name], ["commit", "-m", message]], cwd=repo_path)
+
+
+class _CatFile:
+    """A long-running `git cat-file --batch-check` process that resolves revisions for one directory."""
+
+    def __init__(self, cwd: str) -> None:
+        self.process = subprocess.Popen(
+            ["git", "cat-file", "--batch-check=%(objectname)"],
+            cwd=cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+
+    def resolve(self, revs: list[str]) -> list[str | None]:
+        """
+        Returns the object name for each of `revs`, or None for those that don't resolve to an object.
+
+        All revisions are written before any answer is read, so a batch costs one round trip.
+        """
+        self.process.stdin.write("".join(rev + "\n" for rev in revs))
+        self.process.stdin.flush()
+        object_names: list[str | None] = []
+        for _ in revs:
+            line = self.process.stdout.readline()
+            if not line:
+                raise BrokenPipeError("git cat-file exited")
+            line = line.strip()
+            # Unresolvable input is echoed back as "<rev> missing" (or "ambiguous")
+            object_names.append(None if " " in line else line)
+        return object_names
+
+    def close(self) -> None:
+        self.process.stdin.close()
+        self.process.wait()
+
+
+# One batch process per repository directory, closed by close_cat_files() at fixture teardown
+_cat_files: dict[str, _CatFile] = {}
+
+
+def close_cat_files() -> None:
+    """Stops all batch processes started by `resolve_rev`."""
+    while _cat_files:
+        _cat_files.popitem()[1].close()
+
+
+def resolve_revs(*revs: str) -> list[str]:
+    """
+    Resolves revisions to commit hashes in the current directory, in order.
+
+    Lookups go through a persistent `git cat-file` process instead of spawning
+    `git rev-parse` each time. Revisions it can't resolve, or all of them if that
+    process has died, fall back to `git rev-parse`, which also raises
+    CalledProcessError for unknown revisions.
+    """
+    cwd = os.getcwd()
+    cat_file = _cat_files.get(cwd)
+    try:
+        if cat_file is None:
+            cat_file = _cat_files[cwd] = _CatFile(cwd)
+        object_names = cat_file.resolve(list(revs))
+    except OSError:
+        _cat_files.pop(cwd, None)
+        object_names = [None] * len(revs)
+    return [
+        object_name or run_git_command(["rev-parse", "--verify", rev], capture_output=True).stdout.strip()
+        for rev, object_name in zip(revs, object_names, strict=True)
+    ]
+
+
+def resolve_rev(rev: str) -> str:
+    """Resolves a single revision to a commit hash in the current directory."""
+    return resolve_revs(rev)[0]
+
+
+def get_hashes(*refs: str) -> list[str]:
+    """Helper to get the commit hashes of several refs with a single lookup."""
+    return resolve_revs(*refs)
+
+
 def get_commit_hash(branch: str) -> str:
     """Helper to get the current commit hash of a branch."""
-    return run_git_command(["rev-parse", branch]).stdout.strip()
+    return resolve_rev(branch)
 
 
 def get_parent_hash(branch: str) -> str:
     """Helper to get the parent commit hash of a branch's HEAD."""
-    return run_git_command(["rev-parse", f"{branch}^"]).stdout.strip()
+    return resolve_rev(f"{branch}^")